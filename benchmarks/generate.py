@@ -0,0 +1,190 @@
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from sqlalchemy import create_engine
+
+from database.source_db import Base
+import utils.models  # noqa: F401 - registers the tables on Base.metadata
+
+# Excel sheets stop at 1,048,576 rows, header included.
+EXCEL_MAX_ROWS = 1_048_575
+
+SCALES = {
+    "10k": 10_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+
+CITIES = ["Lahore", "Karachi", "Islamabad", "Berlin", "London", "Toronto", "Austin", "Sydney"]
+
+
+class DatasetSpec:
+    """Shape of a synthetic dataset matching utils/models.py.
+
+    total_rows is spread over the four tables using the fan-outs: every
+    user writes posts_per_user posts on average (Poisson), every post gets
+    comments_per_post comments, and there is one product per ten users.
+    duplicate_rate is the share of rows that repeat the natural key of an
+    earlier row (email, title, product name, comment text per post), and
+    orphan_rate the share of posts and comments whose parent doesn't exist.
+    """
+
+    def __init__(self, total_rows=10_000, posts_per_user=3.0, comments_per_post=3.0,
+                 duplicate_rate=0.01, orphan_rate=0.01, seed=42):
+        self.total_rows = total_rows
+        self.posts_per_user = posts_per_user
+        self.comments_per_post = comments_per_post
+        self.duplicate_rate = duplicate_rate
+        self.orphan_rate = orphan_rate
+        self.seed = seed
+
+    @property
+    def users(self):
+        per_user = 1 + self.posts_per_user + self.posts_per_user * self.comments_per_post + 0.1
+        return max(1, int(self.total_rows / per_user))
+
+    def to_dict(self):
+        return {
+            "total_rows": self.total_rows,
+            "users": self.users,
+            "posts_per_user": self.posts_per_user,
+            "comments_per_post": self.comments_per_post,
+            "duplicate_rate": self.duplicate_rate,
+            "orphan_rate": self.orphan_rate,
+            "seed": self.seed,
+        }
+
+
+def _labels(prefix, numbers):
+    return prefix + pd.Series(numbers).astype(str)
+
+
+def _duplicate(rng, values, rate):
+    # Replace a share of the values with a value from an earlier position.
+    values = values.copy()
+    count = int(len(values) * rate)
+    if count and len(values) > 1:
+        positions = rng.choice(np.arange(1, len(values)), size=count, replace=False)
+        values.iloc[positions] = values.iloc[rng.integers(0, positions)].to_numpy()
+    return values
+
+
+def _orphan(rng, parent_ids, parent_count, rate):
+    parent_ids = parent_ids.copy()
+    count = int(len(parent_ids) * rate)
+    if count:
+        positions = rng.choice(len(parent_ids), size=count, replace=False)
+        parent_ids[positions] = parent_count + 1 + rng.integers(0, parent_count + 1, size=count)
+    return parent_ids
+
+
+def generate_dataset(spec):
+    """Return {table name: DataFrame} for the spec. The same spec and seed always give the same data."""
+    rng = np.random.default_rng(spec.seed)
+
+    user_ids = np.arange(1, spec.users + 1)
+    users = pd.DataFrame({
+        "id": user_ids,
+        "name": _labels("User ", user_ids),
+        "email": _duplicate(rng, _labels("user", user_ids) + "@example.com", spec.duplicate_rate),
+        "city": rng.choice(CITIES, size=len(user_ids)),
+    })
+
+    author_ids = np.repeat(user_ids, rng.poisson(spec.posts_per_user, size=len(user_ids)))
+    post_ids = np.arange(1, len(author_ids) + 1)
+    posts = pd.DataFrame({
+        "id": post_ids,
+        "title": _duplicate(rng, _labels("Post ", post_ids), spec.duplicate_rate),
+        "content": _labels("Synthetic content for post ", post_ids),
+        "author_id": _orphan(rng, author_ids, len(user_ids), spec.orphan_rate),
+    })
+
+    commented_posts = np.repeat(post_ids, rng.poisson(spec.comments_per_post, size=len(post_ids)))
+    comment_ids = np.arange(1, len(commented_posts) + 1)
+    comment_numbers = comment_ids.copy()
+    duplicates = rng.random(len(comment_ids)) < spec.duplicate_rate
+    comment_numbers[duplicates] = 0
+    comments = pd.DataFrame({
+        "id": comment_ids,
+        "post_id": _orphan(rng, commented_posts, len(post_ids), spec.orphan_rate),
+        "text": _labels("Comment ", comment_numbers),
+        "commenter_name": _labels("User ", rng.integers(1, len(user_ids) + 1, size=len(comment_ids))),
+    })
+
+    product_ids = np.arange(1, max(1, len(user_ids) // 10) + 1)
+    products = pd.DataFrame({
+        "id": product_ids,
+        "name": _duplicate(rng, _labels("Product ", product_ids), spec.duplicate_rate),
+        "price": rng.integers(1, 10_000, size=len(product_ids)),
+        "description": _labels("Synthetic product ", product_ids),
+    })
+
+    return {"users": users, "posts": posts, "comments": comments, "products": products}
+
+
+def dataset_rows(dataset):
+    return sum(len(df) for df in dataset.values())
+
+
+def write_workbook(dataset, path):
+    """Write one sheet per table, streaming rows with openpyxl's write-only mode."""
+    workbook = Workbook(write_only=True)
+    for table_name, df in dataset.items():
+        if len(df) > EXCEL_MAX_ROWS:
+            raise ValueError(f"Sheet '{table_name}' has {len(df)} rows, more than Excel allows")
+        sheet = workbook.create_sheet(table_name)
+        sheet.append(list(df.columns))
+        for row in df.itertuples(index=False, name=None):
+            sheet.append([value.item() if isinstance(value, np.generic) else value for value in row])
+    workbook.save(path)
+    return path
+
+
+def write_csv_zip(dataset, path):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for table_name, df in dataset.items():
+            archive.writestr(f"{table_name}.csv", df.to_csv(index=False))
+    return path
+
+
+def write_upload_file(dataset, directory):
+    """Write the dataset as an upload: a workbook when it fits in Excel, a zip of CSVs otherwise."""
+    if max(len(df) for df in dataset.values()) <= EXCEL_MAX_ROWS:
+        return write_workbook(dataset, os.path.join(directory, "dataset.xlsx"))
+    return write_csv_zip(dataset, os.path.join(directory, "dataset.zip"))
+
+
+def source_tables(dataset):
+    """Return the dataset as a source database can hold it.
+
+    users.email is unique, so repeated emails keep their first row and
+    posts written by a dropped duplicate point at that row instead.
+    """
+    users = dataset["users"]
+    first_ids = users.groupby("email")["id"].transform("min")
+    moved = dict(zip(users["id"], first_ids))
+
+    posts = dataset["posts"].copy()
+    posts["author_id"] = posts["author_id"].map(moved).fillna(posts["author_id"]).astype("int64")
+    return {**dataset, "users": users[users["id"] == first_ids], "posts": posts}
+
+
+def write_source_database(dataset, path, chunk_size=50_000):
+    """Create a SQLite database with the model tables and the dataset in it; return its URL."""
+    if os.path.exists(path):
+        os.remove(path)
+
+    tables = source_tables(dataset)
+
+    db_url = f"sqlite:///{path}"
+    engine = create_engine(db_url)
+    try:
+        Base.metadata.create_all(engine)
+        for table_name in ("users", "products", "posts", "comments"):
+            tables[table_name].to_sql(table_name, engine, if_exists="append", index=False, chunksize=chunk_size)
+    finally:
+        engine.dispose()
+    return db_url
@@ -0,0 +1,258 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.generate import (
+    SCALES, DatasetSpec, generate_dataset, dataset_rows, write_upload_file, write_source_database
+)
+from database.engine_registry import engine_registry
+from database.source_db import Base
+from utils.handle_functions import migrate_known_tables, reflect_metadata
+from utils.insert_data import insert_data_in_table
+from utils.jobs import Job
+from utils.read_file import read_file_sync
+
+
+class SqliteHandler:
+    """Stands in for the SQL Server handlers: the same engine / get_session surface, backed by a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.engine = engine_registry.get_engine(f"sqlite:///{path}")
+        self.SessionLocal = sessionmaker(bind=self.engine, autoflush=False)
+
+    def get_session(self):
+        return self.SessionLocal()
+
+
+def peak_rss_mb():
+    # ru_maxrss survives exec, so on Linux a spawned benchmark would report
+    # its parent's peak; VmHWM belongs to this process's own address space.
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(name, options, trace_memory=False):
+    """Run one benchmark in this process and return its numbers.
+
+    Tracing allocations slows the code under test down several times, so
+    a run either times the benchmark or traces its memory, never both.
+    """
+    func = BENCHMARKS[name](**options)
+    try:
+        if trace_memory:
+            tracemalloc.start()
+            try:
+                func()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            return {"peak_traced_mb": peak / (1024 * 1024)}
+
+        start = time.perf_counter()
+        details = func()
+        seconds = time.perf_counter() - start
+        return {"seconds": seconds, "peak_rss_mb": peak_rss_mb(), **details}
+    finally:
+        engine_registry.dispose_all()
+
+
+def in_subprocess(*args):
+    # ru_maxrss is the high-water mark of the whole process, so every run
+    # gets a fresh interpreter that hasn't generated data or run another
+    # benchmark before.
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_benchmark, *args).result()
+
+
+def measure(name, rows, options, trace_memory=False):
+    """Run a benchmark in a subprocess and return its timing, throughput and memory numbers.
+
+    With trace_memory, a second run in another subprocess measures the
+    peak of Python allocations.
+    """
+    timed = in_subprocess(name, options)
+    traced = in_subprocess(name, options, True) if trace_memory else {"peak_traced_mb": None}
+    seconds = timed.pop("seconds")
+    return {
+        "benchmark": name,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+        "peak_traced_mb": traced["peak_traced_mb"],
+        "peak_rss_mb": timed.pop("peak_rss_mb"),
+        **timed,
+    }
+
+
+def fresh_target(target_path):
+    # Every run starts from an empty target, including the memory pass
+    # and reruns with the same --workdir.
+    if os.path.exists(target_path):
+        os.remove(target_path)
+
+
+def bench_read_file(upload_path, batch_size):
+    def run():
+        rows = 0
+        with read_file_sync(upload_path, os.path.basename(upload_path), batch_size) as sheets:
+            for batches in sheets.values():
+                for df in batches:
+                    rows += len(df)
+        return {"rows_read": rows}
+    return run
+
+
+def bench_insert_data(upload_path, target_path, batch_size):
+    def run():
+        fresh_target(target_path)
+        handler = SqliteHandler(target_path)
+        job = Job("benchmark", os.path.basename(target_path), None, ())
+        with read_file_sync(upload_path, os.path.basename(upload_path), batch_size) as sheets:
+            results = insert_data_in_table(sheets, handler, job=job)
+        return {"result": results, "stages": job.to_dict()["metrics"]}
+    return run
+
+
+def bench_migrate(source_path, target_path, chunk_size, range_workers):
+    def run():
+        fresh_target(target_path)
+        source = SqliteHandler(source_path)
+        target = SqliteHandler(target_path)
+        job = Job("benchmark", os.path.basename(target_path), None, ())
+        source_metadata = reflect_metadata(source)
+        source_metadata.create_all(target.engine)
+        inserted = migrate_known_tables(
+            source.get_session, target.get_session, source_metadata,
+            chunk_size=chunk_size, job=job, range_workers=range_workers
+        )
+        return {"result": inserted, "stages": job.to_dict()["metrics"]}
+    return run
+
+
+BENCHMARKS = {
+    "read_file": bench_read_file,
+    "insert_data": bench_insert_data,
+    "migrate": bench_migrate,
+}
+
+
+def print_report(report):
+    print(f"\nUpload: {report['dataset']['rows']} rows, source database: {report['dataset']['tables']}")
+    print(f"{'benchmark':<16}{'rows':>12}{'seconds':>10}{'rows/s':>12}{'traced MB':>11}{'RSS MB':>9}")
+    for result in report["results"]:
+        traced = "-" if result["peak_traced_mb"] is None else f"{result['peak_traced_mb']:.1f}"
+        print(
+            f"{result['benchmark']:<16}{result['rows']:>12}{result['seconds']:>10.2f}"
+            f"{result['rows_per_second']:>12.0f}{traced:>11}{result['peak_rss_mb']:>9.1f}"
+        )
+        for stage, summary in sorted(result.get("stages", {}).items()):
+            print(f"  {stage:<14}{summary['rows']:>12}{summary['seconds']:>10.2f}{summary['rows_per_second']:>12.0f}")
+
+
+def run_benchmarks(spec, workdir, batch_size=10_000, chunk_size=10_000, range_workers=1, benchmarks=None,
+                   trace_memory=False):
+    benchmarks = benchmarks or ["read_file", "insert_data", "migrate"]
+
+    started = time.perf_counter()
+    dataset = generate_dataset(spec)
+    rows = dataset_rows(dataset)
+    upload_path = write_upload_file(dataset, workdir)
+    source_path = os.path.join(workdir, "source.db")
+    write_source_database(dataset, source_path)
+    print(f"Generated {rows} rows in {time.perf_counter() - started:.1f}s under {workdir}")
+    del dataset
+
+    # The source database drops duplicate emails, so it can hold fewer rows than the upload.
+    tables = {}
+    with SqliteHandler(source_path).engine.connect() as conn:
+        for table in Base.metadata.sorted_tables:
+            tables[table.name] = conn.exec_driver_sql(f"SELECT COUNT(*) FROM {table.name}").scalar()
+    source_rows = sum(tables.values())
+
+    options = {
+        "read_file": {"upload_path": upload_path, "batch_size": batch_size},
+        "insert_data": {
+            "upload_path": upload_path,
+            "target_path": os.path.join(workdir, "insert_target.db"),
+            "batch_size": batch_size,
+        },
+        "migrate": {
+            "source_path": source_path,
+            "target_path": os.path.join(workdir, "migrate_target.db"),
+            "chunk_size": chunk_size,
+            "range_workers": range_workers,
+        },
+    }
+
+    results = []
+    for name in benchmarks:
+        print(f"Running {name}...")
+        results.append(measure(name, source_rows if name == "migrate" else rows, options[name], trace_memory))
+
+    engine_registry.dispose_all()
+    return {"spec": spec.to_dict(), "dataset": {"rows": rows, "tables": tables}, "results": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark uploads and migrations on synthetic SQLite data.")
+    parser.add_argument("--scale", choices=sorted(SCALES, key=SCALES.get), default="10k")
+    parser.add_argument("--rows", type=int, help="Total rows to generate; overrides --scale")
+    parser.add_argument("--posts-per-user", type=float, default=3.0)
+    parser.add_argument("--comments-per-post", type=float, default=3.0)
+    parser.add_argument("--duplicate-rate", type=float, default=0.01)
+    parser.add_argument("--orphan-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--range-workers", type=int, default=1)
+    parser.add_argument("--only", action="append", choices=["read_file", "insert_data", "migrate"],
+                        help="Run only this benchmark; repeat to pick several")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Run every benchmark a second time to measure its peak Python allocations")
+    parser.add_argument("--workdir", help="Where to keep the generated files; a temporary directory by default")
+    parser.add_argument("--output", help="Also write the report as JSON to this path")
+    args = parser.parse_args(argv)
+
+    spec = DatasetSpec(
+        total_rows=args.rows or SCALES[args.scale],
+        posts_per_user=args.posts_per_user,
+        comments_per_post=args.comments_per_post,
+        duplicate_rate=args.duplicate_rate,
+        orphan_rate=args.orphan_rate,
+        seed=args.seed,
+    )
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="dbapp-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        report = run_benchmarks(
+            spec, workdir, args.batch_size, args.chunk_size, args.range_workers, args.only, args.trace_memory
+        )
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
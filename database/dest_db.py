@@ -1,8 +1,10 @@
 import os
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from dotenv import load_dotenv
+from database.engine_registry import engine_registry
+from database.schema_bootstrap import schema_bootstrap
 
 load_dotenv()
 
@@ -15,16 +17,21 @@ Base = declarative_base()
 class TargetDatabaseHandler:
     def __init__(self, db_name):
         self.db_name = db_name
+        self.host = DB_HOST
         self.admin_db = os.getenv("MSSQL_ADMIN_DB")
         self.engine = None
         self.session = None
+        self.session_factory = None
         self.master_url = (
             f"mssql+pyodbc://{DB_USER}@{DB_HOST}/{self.admin_db}"
             f"?driver=ODBC+Driver+17+for+SQL+Server&trusted_connection=yes"
         )
 
     def create_db(self):
-        master_engine = create_engine(self.master_url)
+        schema_bootstrap.ensure_database(self.host, self.db_name, self._create_db)
+
+    def _create_db(self):
+        master_engine = engine_registry.get_engine(self.master_url)
 
         with master_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
             exists = conn.execute(
@@ -43,19 +50,23 @@ class TargetDatabaseHandler:
             f"mssql+pyodbc://{DB_USER}@{DB_HOST}/{self.db_name}"
             f"?driver=ODBC+Driver+17+for+SQL+Server&trusted_connection=yes"
         )
-        self.engine = create_engine(db_url)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
+        self.engine = engine_registry.get_engine(db_url)
+        self.session_factory = sessionmaker(bind=self.engine)
+        self.session = self.session_factory()
+
+    def get_session(self):
+        return self.session_factory()
 
     def init_db(self, source_metadata):
         self.connect()
         if not self.engine:
             raise Exception("Engine not created. Call connect() first.")
-        source_metadata.create_all(bind=self.engine)
-        print("Tables created in target database from source metadata.")
+        if schema_bootstrap.ensure_tables(self.engine, source_metadata):
+            print("Tables created in target database from source metadata.")
 
     def disconnect(self):
         if self.session:
             self.session.close()
-        if self.engine:
-            self.engine.dispose()
+        self.session = None
+        self.session_factory = None
+        self.engine = None
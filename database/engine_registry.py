@@ -0,0 +1,73 @@
+import os
+import threading
+from collections import OrderedDict
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from dotenv import load_dotenv
+from utils.bulk_writer import engine_options
+from utils.metrics import instrument_engine
+from utils.response_cache import response_cache
+
+load_dotenv()
+
+ENGINE_CACHE_SIZE = int(os.getenv("ENGINE_CACHE_SIZE", "16"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+class EngineRegistry:
+    def __init__(self, max_engines=ENGINE_CACHE_SIZE, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW):
+        self.max_engines = max_engines
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.engines = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def pool_capacity(self):
+        """Connections one engine can hand out at once."""
+        return self.pool_size + self.max_overflow
+
+    def get_engine(self, db_url, **options):
+        url = make_url(db_url)
+        key = (url.host, url.database, url.render_as_string(hide_password=False))
+
+        with self.lock:
+            engine = self.engines.get(key)
+            if engine is not None:
+                self.engines.move_to_end(key)
+                return engine
+
+            engine = create_engine(db_url, **self._pool_options(url), **engine_options(db_url), **options)
+            instrument_engine(engine)
+            response_cache.watch(engine)
+            self.engines[key] = engine
+
+            while len(self.engines) > self.max_engines:
+                _, evicted = self.engines.popitem(last=False)
+                evicted.dispose()
+
+        return engine
+
+    def dispose_all(self):
+        with self.lock:
+            engines = list(self.engines.values())
+            self.engines.clear()
+        for engine in engines:
+            engine.dispose()
+
+    def _pool_options(self, url):
+        options = {"pool_pre_ping": True}
+        if url.get_backend_name() != "sqlite":
+            options.update(
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_timeout=DB_POOL_TIMEOUT
+            )
+        return options
+
+
+engine_registry = EngineRegistry()
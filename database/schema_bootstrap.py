@@ -0,0 +1,54 @@
+import hashlib
+import threading
+
+
+def schema_version(metadata):
+    # Tables, columns and column types, so a model change gets a new version
+    # and is provisioned again.
+    definition = sorted(
+        (table.name, tuple((column.name, str(column.type)) for column in table.columns))
+        for table in metadata.tables.values()
+    )
+    return hashlib.sha1(repr(definition).encode()).hexdigest()
+
+
+class SchemaBootstrap:
+    """Remembers which databases and schemas this process already provisioned.
+
+    create_db and create_all are only run the first time a (server,
+    database[, schema version]) is seen. A job that fails calls invalidate,
+    so the next one checks the database again instead of trusting the cache.
+    """
+
+    def __init__(self):
+        self.provisioned = set()
+        self.lock = threading.Lock()
+
+    def _run_once(self, key, provision):
+        with self.lock:
+            if key in self.provisioned:
+                return False
+
+        provision()
+        with self.lock:
+            self.provisioned.add(key)
+        return True
+
+    def ensure_database(self, host, db_name, create):
+        return self._run_once(("database", host, db_name), create)
+
+    def ensure_tables(self, engine, metadata):
+        key = ("tables", engine.url.host, engine.url.database, schema_version(metadata))
+        return self._run_once(key, lambda: metadata.create_all(bind=engine))
+
+    def invalidate(self, host=None, db_name=None):
+        with self.lock:
+            if host is None and db_name is None:
+                self.provisioned.clear()
+                return
+            self.provisioned = {
+                key for key in self.provisioned if (key[1], key[2]) != (host, db_name)
+            }
+
+
+schema_bootstrap = SchemaBootstrap()
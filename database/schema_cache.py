@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import MetaData, text
+
+SCHEMA_CACHE_SIZE = int(os.getenv("SCHEMA_CACHE_SIZE", "32"))
+SCHEMA_CACHE_TTL = int(os.getenv("SCHEMA_CACHE_TTL", "600"))
+
+
+def schema_fingerprint(engine):
+    # Anything that changes a table definition (CREATE/ALTER/DROP, new keys
+    # or constraints) moves these, so a cached reflection is only reused
+    # while they are unchanged.
+    with engine.connect() as conn:
+        if engine.dialect.name == "mssql":
+            row = conn.execute(text(
+                "SELECT COUNT(*), MAX(modify_date) FROM sys.objects WHERE is_ms_shipped = 0"
+            )).one()
+            return tuple(row)
+        if engine.dialect.name == "sqlite":
+            return conn.execute(text("PRAGMA schema_version")).scalar()
+    return None
+
+
+class SchemaCache:
+    """Reflected MetaData per (server, database, schema fingerprint, tables).
+
+    Entries expire after ttl seconds and the least recently used one is
+    dropped past max_entries. Cached MetaData is shared between jobs and
+    must be treated as read-only.
+    """
+
+    def __init__(self, max_entries=SCHEMA_CACHE_SIZE, ttl=SCHEMA_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def reflect(self, engine, only=None, exclude=()):
+        """Reflect the tables named in only (plus the tables their foreign keys
+        reach), or every table except those in exclude when only is None.
+        """
+        url = engine.url
+        tables = tuple(sorted(only)) if only else None
+        key = (url.host, url.database, tables, tuple(sorted(exclude)))
+        fingerprint = schema_fingerprint(engine)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                metadata, cached_fingerprint, created_at = entry
+                if cached_fingerprint == fingerprint and time.time() - created_at < self.ttl:
+                    self.entries.move_to_end(key)
+                    return metadata
+                del self.entries[key]
+
+        metadata = MetaData()
+        if tables is not None:
+            metadata.reflect(bind=engine, only=list(tables))
+        else:
+            metadata.reflect(bind=engine, only=lambda name, _: name not in exclude)
+
+        with self.lock:
+            self.entries[key] = (metadata, fingerprint, time.time())
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return metadata
+
+    def invalidate(self, engine=None):
+        with self.lock:
+            if engine is None:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries if key[:2] == (engine.url.host, engine.url.database)]:
+                del self.entries[key]
+
+
+schema_cache = SchemaCache()
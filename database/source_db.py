@@ -1,7 +1,9 @@
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker, declarative_base
+from database.engine_registry import engine_registry
+from database.schema_bootstrap import schema_bootstrap
 
 
 load_dotenv()
@@ -27,13 +29,12 @@ class DatabaseHandler:
         )
 
     def create_db(self):
+        schema_bootstrap.ensure_database(self.host, self.db_name, self._create_db)
+
+    def _create_db(self):
         temp_url = self.base_url.replace(f"/{self.db_name}", f"/{self.admin_db}")
-        engine = create_engine(
-            temp_url,
-            isolation_level="AUTOCOMMIT",
-            connect_args={"timeout": 30}
-        )
-        with engine.connect() as conn:
+        engine = engine_registry.get_engine(temp_url, connect_args={"timeout": 30})
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
             conn.execute(text(
                 f"IF NOT EXISTS (SELECT * FROM sys.databases WHERE name = N'{self.db_name}') "
                 f"CREATE DATABASE [{self.db_name}]"
@@ -43,13 +44,15 @@ class DatabaseHandler:
         return self.session_factory()
 
     def connect_db(self):
-        self.engine = create_engine(self.base_url)
+        self.engine = engine_registry.get_engine(self.base_url)
         self.session_factory = sessionmaker(bind=self.engine)
 
     def init_db(self):
-        Base.metadata.create_all(self.engine)
+        schema_bootstrap.ensure_tables(self.engine, Base.metadata)
 
     def disconnect_db(self):
+        # The engine and its pool belong to the registry and are reused by
+        # the next job against this database.
         self.engine = None
         self.session_factory = None
 
@@ -1,11 +1,35 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from database.engine_registry import engine_registry
 from routers.index import router as model_router
 from routers.index import router as migrate_router
+from routers.jobs import router as jobs_router
+from routers.data import router as data_router
+from utils.jobs import job_manager
+from utils.metrics import metrics
 
-app = FastAPI(title="Database Migration App")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    engine_registry.dispose_all()
+
+
+app = FastAPI(title="Database Migration App", lifespan=lifespan)
 
 app.include_router(model_router)
 app.include_router(migrate_router)
+app.include_router(jobs_router)
+app.include_router(data_router)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(
+        metrics.render(job_manager.state_counts()),
+        media_type="text/plain; version=0.0.4"
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,88 @@
+from fastapi import APIRouter, HTTPException, Header, Query, Response, status
+from sqlalchemy.exc import SQLAlchemyError
+from database.source_db import DatabaseHandler
+from utils.models import User, Post, Comment, Product
+from utils.read_pages import page_response, READ_PAGE_SIZE, READ_PAGE_MAX
+from utils.schemas import UserPage, PostPage, CommentPage, ProductPage
+
+router = APIRouter(prefix="/data")
+
+
+def etag_matches(etag, if_none_match):
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def page(db_name, table, after, limit, filters, if_none_match):
+    if not 1 <= limit <= READ_PAGE_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Limit must be between 1 and {READ_PAGE_MAX}"
+        )
+
+    db_handler = DatabaseHandler(db_name)
+    db_handler.connect_db()
+    try:
+        body, etag = page_response(db_handler.engine, table, after, limit, filters)
+    except SQLAlchemyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Database error: {str(e)}"
+        )
+    finally:
+        db_handler.disconnect_db()
+
+    if etag_matches(etag, if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+# Plain defs: FastAPI runs them in the threadpool, so the database reads
+# don't hold up the event loop. Each page lists rows with an id above
+# `after`; pass the returned next_cursor as `after` to get the next one.
+
+@router.get("/{db_name}/users", response_model=UserPage)
+def list_users(
+        db_name: str,
+        after: int = Query(None),
+        limit: int = Query(READ_PAGE_SIZE),
+        city: str = Query(None),
+        email: str = Query(None),
+        if_none_match: str = Header(None)
+):
+    return page(db_name, User.__table__, after, limit, {"city": city, "email": email}, if_none_match)
+
+
+@router.get("/{db_name}/posts", response_model=PostPage)
+def list_posts(
+        db_name: str,
+        after: int = Query(None),
+        limit: int = Query(READ_PAGE_SIZE),
+        author_id: int = Query(None),
+        if_none_match: str = Header(None)
+):
+    return page(db_name, Post.__table__, after, limit, {"author_id": author_id}, if_none_match)
+
+
+@router.get("/{db_name}/comments", response_model=CommentPage)
+def list_comments(
+        db_name: str,
+        after: int = Query(None),
+        limit: int = Query(READ_PAGE_SIZE),
+        post_id: int = Query(None),
+        if_none_match: str = Header(None)
+):
+    return page(db_name, Comment.__table__, after, limit, {"post_id": post_id}, if_none_match)
+
+
+@router.get("/{db_name}/products", response_model=ProductPage)
+def list_products(
+        db_name: str,
+        after: int = Query(None),
+        limit: int = Query(READ_PAGE_SIZE),
+        name: str = Query(None),
+        if_none_match: str = Header(None)
+):
+    return page(db_name, Product.__table__, after, limit, {"name": name}, if_none_match)
@@ -1,14 +1,48 @@
-from fastapi import APIRouter, HTTPException, Form, status, UploadFile, File
-import threading
-from utils.threading_functions import run_migration, run_insert_data
+import os
+import tempfile
+import time
+from fastapi import APIRouter, HTTPException, Form, Query, status, UploadFile, File
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import SQLAlchemyError
+from database.source_db import DatabaseHandler
+from utils.threading_functions import run_migration, run_fan_out_migration, run_insert_data
+from utils.jobs import job_manager, JobQueueFull
+from utils.handle_functions import MIGRATION_RANGE_WORKERS, max_range_workers
+from utils.bulk_load import BULK_LOAD_MODE
+from utils.metrics import metrics, UPLOAD_RECEIVE
+from utils.export import export_database
 
 router = APIRouter()
 
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_RANGE_WORKERS = int(os.getenv("MAX_RANGE_WORKERS", "16"))
+
+
+async def spool_upload(file: UploadFile):
+    suffix = os.path.splitext(file.filename)[1]
+    spool = tempfile.NamedTemporaryFile(prefix="upload_", suffix=suffix, delete=False)
+    try:
+        with spool:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                spool.write(chunk)
+    except Exception:
+        os.remove(spool.name)
+        raise
+    return spool.name
+
+
+def submit_job(kind, target_db, func, *args, cleanup=None):
+    try:
+        return job_manager.submit(kind, target_db, func, *args, cleanup=cleanup)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+
 
 @router.post("/insert_data")
 async def insert_data(
         db_name: str = Form(...),
-        file: UploadFile = File(...)
+        file: UploadFile = File(...),
+        bulk_load: bool = Form(BULK_LOAD_MODE)
 ):
     if not db_name.strip() or not file.filename:
         raise HTTPException(
@@ -16,31 +50,102 @@ async def insert_data(
             detail="Please provide a valid database name in the 'db_name' field and upload a valid file in the 'file' field"
         )
 
-    file_content = await file.read()
+    started = time.perf_counter()
+    file_path = await spool_upload(file)
+    received = time.perf_counter() - started
+    size = os.path.getsize(file_path)
 
-    thread = threading.Thread(
-        target=run_insert_data,
-        args=(db_name, file_content, file.filename)
-    )
-    thread.start()
+    try:
+        job = submit_job(
+            "insert_data", db_name, run_insert_data, db_name, file_path, file.filename, file.content_type,
+            bulk_load, cleanup=lambda: os.remove(file_path)
+        )
+    except HTTPException:
+        os.remove(file_path)
+        raise
+
+    metrics.observe(UPLOAD_RECEIVE, received, size=size, job=job)
 
     return {
-        "message": "Data insertion started in background."
+        "message": "Data insertion started in background.",
+        "job_id": job.id
     }
 
 
 @router.post("/migrate_data")
-async def migrate_data(source_db: str = Form(...), target_db: str = Form(...)):
+async def migrate_data(
+        source_db: str = Form(...),
+        target_db: str = Form(...),
+        range_workers: int = Form(MIGRATION_RANGE_WORKERS),
+        tables: str = Form(None),
+        bulk_load: bool = Form(BULK_LOAD_MODE)
+):
     for name, value in {"source_db": source_db, "target_db": target_db}.items():
         if not value.strip():
             raise HTTPException(
                 status_code=400,
                 detail=f"{name.replace('_', ' ').title()} is required"
             )
+    # The ranges of one migration share the engine pools, which caps how
+    # many of them a table can copy at once; tables running together split
+    # that between them.
+    range_limit = min(MAX_RANGE_WORKERS, max_range_workers())
+    if not 1 <= range_workers <= range_limit:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range workers must be between 1 and {range_limit}; raise DB_POOL_SIZE or "
+                   f"DB_MAX_OVERFLOW for more"
+        )
+
+    # Only the listed tables (comma separated) and the tables they reference
+    # are migrated; without a list the whole source database is.
+    table_names = [name.strip() for name in tables.split(",") if name.strip()] if tables else None
 
-    thread = threading.Thread(target=run_migration, args=(source_db, target_db))
-    thread.start()
+    # Several targets (comma separated) are fed from a single read of the
+    # source, each by a writer of its own.
+    target_dbs = list(dict.fromkeys(name.strip() for name in target_db.split(",") if name.strip()))
+    if not target_dbs:
+        raise HTTPException(status_code=400, detail="Target Db is required")
+
+    if len(target_dbs) > 1:
+        job = submit_job(
+            "migrate_data", target_dbs, run_fan_out_migration, source_db, target_dbs, table_names, bulk_load
+        )
+    else:
+        job = submit_job(
+            "migrate_data", target_dbs[0], run_migration, source_db, target_dbs[0], range_workers, table_names,
+            bulk_load
+        )
 
     return {
-        "message": f"Migration from '{source_db}' to '{target_db}' has started in the background."
+        "message": f"Migration from '{source_db}' to {', '.join(repr(name) for name in target_dbs)} "
+                   f"has started in the background.",
+        "job_id": job.id
     }
+
+
+@router.get("/export/{db_name}")
+def export_data(
+        db_name: str,
+        file_format: str = Query("csv", alias="format"),
+        tables: str = Query(None)
+):
+    # A plain def so the table checks run in the threadpool; the body is
+    # read from the database as the client downloads it.
+    table_names = [name.strip() for name in tables.split(",") if name.strip()] if tables else None
+
+    db_handler = DatabaseHandler(db_name)
+    try:
+        db_handler.connect_db()
+        body, media_type, filename = export_database(db_handler, file_format.lower(), table_names)
+    except SQLAlchemyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Database error: {str(e)}"
+        )
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,76 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database.source_db import Base
+import utils.models  # noqa: F401  (registers the tables on Base.metadata)
+from utils.models import User, Post, Comment, Product
+
+
+def sqlite_engine(path):
+    # Files rather than :memory:, since migrations open several connections
+    # from several threads.
+    return create_engine(f"sqlite:///{path}")
+
+
+@pytest.fixture
+def source_engine(tmp_path):
+    engine = sqlite_engine(tmp_path / "source.db")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def target_engine(tmp_path):
+    engine = sqlite_engine(tmp_path / "target.db")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def target_session(target_engine):
+    session = sessionmaker(bind=target_engine)()
+    yield session
+    session.close()
+
+
+def fill_source(engine, users=20, posts_per_user=3, comments_per_post=2, products=5):
+    """Write a small users -> posts -> comments source, plus unrelated products."""
+    post_count = users * posts_per_user
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": i, "name": f"user {i}", "email": f"user{i}@example.com", "city": "Lyon"}
+            for i in range(1, users + 1)
+        ])
+        conn.execute(Post.__table__.insert(), [
+            {"id": i, "title": f"post {i}", "content": "text", "author_id": (i - 1) % users + 1}
+            for i in range(1, post_count + 1)
+        ])
+        conn.execute(Comment.__table__.insert(), [
+            {"id": i, "post_id": (i - 1) % post_count + 1, "text": f"comment {i}", "commenter_name": "reader"}
+            for i in range(1, post_count * comments_per_post + 1)
+        ])
+        conn.execute(Product.__table__.insert(), [
+            {"id": i, "name": f"product {i}", "price": i * 10, "description": "thing"}
+            for i in range(1, products + 1)
+        ])
+
+
+@pytest.fixture
+def databases(tmp_path, monkeypatch):
+    """Point DatabaseHandler at SQLite files under tmp_path; returns db name -> path."""
+    from database.engine_registry import engine_registry
+    from database.source_db import DatabaseHandler
+
+    def path(db_name):
+        return tmp_path / f"{db_name}.db"
+
+    def connect_db(self):
+        self.engine = engine_registry.get_engine(f"sqlite:///{path(self.db_name)}")
+        self.session_factory = sessionmaker(bind=self.engine)
+
+    monkeypatch.setattr(DatabaseHandler, "connect_db", connect_db)
+    yield path
+    engine_registry.dispose_all()
@@ -0,0 +1,97 @@
+import sqlite3
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from utils.batch_sizing import BatchSizer, with_back_off, error_signal, LOCK_TIMEOUT, SLOW_BATCH
+from utils.bulk_writer import BulkWriter
+from utils.models import Product
+
+
+def locked_error():
+    return OperationalError("INSERT", {}, sqlite3.OperationalError("database is locked"))
+
+
+def test_grows_while_throughput_improves_then_keeps_the_best_size():
+    sizer = BatchSizer(100, minimum=10, maximum=1000, window=1)
+
+    sizer.observe(100, 1.0)  # 100 rows/s
+    assert sizer.size == 200
+    sizer.observe(200, 1.0)  # 200 rows/s
+    assert sizer.size == 400
+    sizer.observe(400, 4.0)  # 100 rows/s, worse
+    assert sizer.size == 200
+    assert not sizer.growing
+
+
+def test_slow_batch_halves_the_size_and_caps_growth():
+    sizer = BatchSizer(400, minimum=10, maximum=1000, max_seconds=1.0)
+    sizer.observe(400, 2.0)
+    assert sizer.size == 200
+    assert sizer.ceiling == 200
+    assert sizer.report()["signals"] == {SLOW_BATCH: 1}
+
+
+def test_back_off_stops_at_the_minimum():
+    sizer = BatchSizer(40, minimum=10)
+    assert sizer.back_off(LOCK_TIMEOUT)
+    assert sizer.back_off(LOCK_TIMEOUT)
+    assert sizer.size == 10
+    assert not sizer.back_off(LOCK_TIMEOUT)
+
+
+def test_error_signal_ignores_errors_a_smaller_batch_cannot_fix():
+    assert error_signal(locked_error()) == LOCK_TIMEOUT
+    assert error_signal(ValueError("database is locked")) is None
+
+
+def test_with_back_off_retries_with_smaller_batches():
+    sizer = BatchSizer(400, minimum=10)
+    rollbacks = []
+    sizes = []
+
+    def attempt():
+        sizes.append(sizer.size)
+        if len(sizes) < 3:
+            raise locked_error()
+        return "written"
+
+    assert with_back_off(sizer, attempt, lambda: rollbacks.append(True)) == "written"
+    assert sizes == [400, 200, 100]
+    assert len(rollbacks) == 2
+
+
+def test_with_back_off_gives_up_after_the_retries():
+    sizer = BatchSizer(400, minimum=10)
+
+    def attempt():
+        raise locked_error()
+
+    with pytest.raises(OperationalError):
+        with_back_off(sizer, attempt, lambda: None, retries=2)
+    assert sizer.size == 100
+
+
+def test_with_back_off_without_a_sizer_raises_at_once():
+    calls = []
+
+    def attempt():
+        calls.append(True)
+        raise locked_error()
+
+    with pytest.raises(OperationalError):
+        with_back_off(None, attempt, lambda: None)
+    assert len(calls) == 1
+
+
+def test_bulk_writer_takes_its_batch_size_from_the_sizer(target_session):
+    sizer = BatchSizer(3, minimum=1, maximum=100)
+    writer = BulkWriter(target_session, Product.__table__, batch_size=1000, sizer=sizer)
+    assert writer.batch_size == 3
+
+    writer.write([
+        {"id": i, "name": f"product {i}", "price": i, "description": "thing"} for i in range(1, 8)
+    ])
+    writer.flush()
+    assert writer.inserted == 7
+    assert sizer.batches == writer.batches
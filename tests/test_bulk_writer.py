@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import func, select
+
+from utils.bulk_writer import BulkWriter, engine_options
+from utils.models import Product
+
+
+def products(start, count):
+    return [
+        {"id": i, "name": f"product {i}", "price": i, "description": "thing"}
+        for i in range(start, start + count)
+    ]
+
+
+def count_products(session):
+    return session.execute(select(func.count()).select_from(Product.__table__)).scalar()
+
+
+def test_writes_full_batches_and_flushes_the_rest(target_session):
+    writer = BulkWriter(target_session, Product.__table__, batch_size=4)
+
+    writer.write(products(1, 6))
+    assert writer.inserted == 4
+    assert writer.batches == 1
+    assert len(writer.pending) == 2
+
+    writer.write(products(7, 3))
+    assert writer.inserted == 8
+    assert writer.flush() == 9
+    assert writer.batches == 3
+    assert count_products(target_session) == 9
+
+
+def test_flush_without_pending_rows_sends_nothing(target_session):
+    writer = BulkWriter(target_session, Product.__table__, batch_size=4)
+    assert writer.flush() == 0
+    assert writer.batches == 0
+
+
+def test_without_commit_the_caller_owns_the_transaction(target_session):
+    writer = BulkWriter(target_session, Product.__table__, batch_size=2, commit=False)
+    writer.write(products(1, 3))
+    writer.flush()
+    target_session.rollback()
+    assert count_products(target_session) == 0
+
+
+def test_failed_batch_is_rolled_back(target_session):
+    writer = BulkWriter(target_session, Product.__table__, batch_size=10)
+    writer.write(products(1, 2) + products(1, 1))
+    with pytest.raises(Exception):
+        writer.flush()
+    assert writer.inserted == 0
+    assert count_products(target_session) == 0
+
+
+def test_rejects_empty_batches(target_session):
+    with pytest.raises(ValueError):
+        BulkWriter(target_session, Product.__table__, batch_size=0)
+
+
+def test_fast_executemany_is_only_passed_to_pyodbc():
+    assert engine_options("mssql+pyodbc://user@host/db?driver=ODBC+Driver+18+for+SQL+Server") == {
+        "fast_executemany": True
+    }
+    assert engine_options("sqlite:///local.db") == {}
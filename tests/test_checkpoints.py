@@ -0,0 +1,109 @@
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.orm import sessionmaker
+
+from tests.conftest import fill_source
+from utils.checkpoints import ensure_checkpoint_table, checkpoints, id_mappings
+from utils.handle_functions import migrate_known_tables, reflect_metadata
+from utils.jobs import Job, JobCancelled
+from utils.models import User
+
+SOURCE_KEY = "source"
+
+
+class Engine:
+    """The part of a database handler reflect_metadata uses."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+
+class CancelAfter(Job):
+    """Cancels itself once limit rows of table_name were committed."""
+
+    def __init__(self, table_name, limit):
+        super().__init__("migrate_data", "target", None, ())
+        self.table_name = table_name
+        self.limit = limit
+
+    def add_rows(self, table_name, count):
+        super().add_rows(table_name, count)
+        if table_name == self.table_name and self.rows[table_name] >= self.limit:
+            self.cancel_event.set()
+
+
+@pytest.fixture
+def migration(source_engine, target_engine):
+    fill_source(source_engine)
+    # A user the target already has: migrated users with that email are
+    # matched to it, and new users are numbered above it.
+    with target_engine.begin() as conn:
+        conn.execute(User.__table__.insert().values(id=1, name="kept", email="user3@example.com", city="Nice"))
+    ensure_checkpoint_table(target_engine)
+    metadata = reflect_metadata(Engine(source_engine))
+
+    def migrate(job=None):
+        return migrate_known_tables(
+            sessionmaker(bind=source_engine), sessionmaker(bind=target_engine), metadata,
+            chunk_size=7, batch_size=5, job=job, workers=1, source_key=SOURCE_KEY
+        )
+
+    return migrate
+
+
+def rows(engine, query):
+    with engine.connect() as conn:
+        return conn.execute(text(query)).fetchall()
+
+
+# Every post with its author's email and every comment with its post's
+# title, which have to match between source and target whatever IDs the
+# target gave the rows.
+POSTS = "SELECT p.title, u.email FROM posts p JOIN users u ON u.id = p.author_id ORDER BY p.title"
+COMMENTS = "SELECT c.text, p.title FROM comments c JOIN posts p ON p.id = c.post_id ORDER BY c.text"
+
+
+def test_interrupted_migration_resumes_after_the_last_committed_chunk(migration, source_engine, target_engine):
+    with pytest.raises(JobCancelled):
+        migration(CancelAfter("posts", 20))
+
+    copied = rows(target_engine, "SELECT COUNT(*) FROM posts")[0][0]
+    assert 20 <= copied < 60
+    with target_engine.connect() as conn:
+        saved = conn.execute(select(checkpoints.c.last_source_id).where(checkpoints.c.table_name == "posts"))
+        assert saved.scalar() == copied
+
+    inserted = migration()
+
+    assert inserted["users"] == 0
+    assert inserted["posts"] == 60 - copied
+    assert inserted["comments"] == 120
+    assert rows(target_engine, "SELECT COUNT(*) FROM users")[0][0] == 20
+    assert rows(target_engine, POSTS) == rows(source_engine, POSTS)
+    assert rows(target_engine, COMMENTS) == rows(source_engine, COMMENTS)
+
+
+def test_rerun_copies_only_rows_added_to_the_source(migration, source_engine, target_engine):
+    migration()
+    assert migration() == {"users": 0, "products": 0, "posts": 0, "comments": 0}
+
+    # Rows added to the target between runs don't collide with the IDs
+    # the next run gives new source rows.
+    with target_engine.begin() as conn:
+        conn.execute(User.__table__.insert().values(id=500, name="other", email="other@example.com", city="Nice"))
+    with source_engine.begin() as conn:
+        conn.execute(User.__table__.insert().values(id=21, name="new", email="new@example.com", city="Lyon"))
+        conn.execute(text("INSERT INTO posts (id, title, content, author_id) VALUES (61, 'post 61', 'text', 3), "
+                          "(62, 'post 62', 'text', 21)"))
+
+    inserted = migration()
+
+    assert inserted["users"] == 1
+    assert inserted["posts"] == 2
+    assert rows(target_engine, "SELECT id FROM users WHERE email = 'new@example.com'")[0][0] > 500
+    assert rows(target_engine, POSTS) == rows(source_engine, POSTS)
+    with target_engine.connect() as conn:
+        mapped = conn.execute(
+            select(id_mappings.c.target_id).where(id_mappings.c.table_name == "users", id_mappings.c.source_id == 3)
+        )
+        assert mapped.scalar() == 1
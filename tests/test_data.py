@@ -0,0 +1,81 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from database.engine_registry import engine_registry
+from database.source_db import Base
+from main import app
+from tests.conftest import sqlite_engine, fill_source
+from utils.response_cache import ResponseCache
+
+
+def source_database(databases, name="read"):
+    engine = sqlite_engine(databases(name))
+    Base.metadata.create_all(engine)
+    fill_source(engine, users=5, posts_per_user=2, comments_per_post=1)
+    engine.dispose()
+    return name
+
+
+def test_pages_follow_the_cursor(databases):
+    name = source_database(databases)
+    client = TestClient(app)
+
+    first = client.get(f"/data/{name}/users", params={"limit": 3}).json()
+    assert [user["id"] for user in first["items"]] == [1, 2, 3]
+    assert first["next_cursor"] == 3
+
+    second = client.get(f"/data/{name}/users", params={"limit": 3, "after": first["next_cursor"]}).json()
+    assert [user["id"] for user in second["items"]] == [4, 5]
+    assert second["next_cursor"] is None
+
+
+def test_filters_narrow_the_page(databases):
+    name = source_database(databases)
+
+    posts = TestClient(app).get(f"/data/{name}/posts", params={"author_id": 2}).json()
+
+    assert [post["id"] for post in posts["items"]] == [2, 7]
+
+
+def test_unchanged_page_is_not_modified(databases):
+    name = source_database(databases)
+    client = TestClient(app)
+
+    response = client.get(f"/data/{name}/products")
+    etag = response.headers["etag"]
+
+    assert client.get(f"/data/{name}/products", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/data/{name}/products", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_writes_through_the_registry_drop_cached_pages(databases):
+    name = source_database(databases)
+    client = TestClient(app)
+    etag = client.get(f"/data/{name}/products").headers["etag"]
+
+    engine = engine_registry.get_engine(f"sqlite:///{databases(name)}")
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE products SET price = 0 WHERE id = 1"))
+
+    response = client.get(f"/data/{name}/products", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["items"][0]["price"] == 0
+
+
+def test_limit_outside_the_allowed_range_is_refused(databases):
+    name = source_database(databases)
+    assert TestClient(app).get(f"/data/{name}/users", params={"limit": 0}).status_code == 400
+
+
+def test_cache_drops_expired_entries_and_responses_read_across_a_commit():
+    cache = ResponseCache(ttl=60)
+    generation = cache.generation("db")
+    cache.invalidate("db")
+    cache.put("db", "page", b"stale", generation)
+    assert cache.get("db", "page") is None
+
+    cache.put("db", "page", b"fresh", cache.generation("db"))
+    assert cache.get("db", "page")[0] == b"fresh"
+
+    cache.ttl = 0
+    assert cache.get("db", "page") is None
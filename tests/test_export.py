@@ -0,0 +1,82 @@
+import io
+import zipfile
+
+import pandas as pd
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from database.engine_registry import engine_registry
+from database.source_db import Base, DatabaseHandler
+from main import app
+from tests.conftest import sqlite_engine, fill_source
+
+
+def source_database(databases, name="exported"):
+    engine = sqlite_engine(databases(name))
+    Base.metadata.create_all(engine)
+    fill_source(engine, users=3, posts_per_user=1, comments_per_post=1, products=2)
+    engine.dispose()
+    return name
+
+
+def test_csv_export_of_one_table(databases):
+    name = source_database(databases)
+
+    response = TestClient(app).get(f"/export/{name}", params={"format": "csv", "tables": "users"})
+
+    assert response.status_code == 200
+    assert 'filename="users.csv"' in response.headers["content-disposition"]
+    users = pd.read_csv(io.BytesIO(response.content))
+    assert users["email"].tolist() == ["user1@example.com", "user2@example.com", "user3@example.com"]
+
+
+def test_export_of_several_tables_is_a_zip_in_load_order(databases):
+    name = source_database(databases)
+
+    response = TestClient(app).get(f"/export/{name}")
+
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == ["users.csv", "products.csv", "posts.csv", "comments.csv"]
+        assert len(pd.read_csv(archive.open("comments.csv"))) == 3
+
+
+def test_xlsx_export_has_a_sheet_per_table(databases):
+    name = source_database(databases)
+
+    response = TestClient(app).get(f"/export/{name}", params={"format": "xlsx", "tables": "users,posts"})
+
+    assert response.status_code == 200
+    sheets = pd.read_excel(io.BytesIO(response.content), sheet_name=None)
+    assert list(sheets) == ["users", "posts"]
+    assert sheets["posts"]["title"].tolist() == ["post 1", "post 2", "post 3"]
+
+
+def test_parquet_export_reads_back(databases):
+    name = source_database(databases)
+
+    response = TestClient(app).get(f"/export/{name}", params={"format": "parquet", "tables": "products"})
+
+    assert response.status_code == 200
+    assert pd.read_parquet(io.BytesIO(response.content))["price"].tolist() == [10, 20]
+
+
+def test_export_refuses_unknown_formats_and_tables(databases):
+    name = source_database(databases)
+    client = TestClient(app)
+
+    assert client.get(f"/export/{name}", params={"format": "json"}).status_code == 400
+    assert client.get(f"/export/{name}", params={"tables": "orders"}).status_code == 400
+
+
+def test_export_of_an_unreachable_database_reports_the_database_error(databases, tmp_path, monkeypatch):
+    def connect_db(self):
+        self.engine = engine_registry.get_engine(f"sqlite:///{tmp_path / 'no-such-directory' / 'missing.db'}")
+        self.session_factory = sessionmaker(bind=self.engine)
+
+    monkeypatch.setattr(DatabaseHandler, "connect_db", connect_db)
+
+    response = TestClient(app).get("/export/missing")
+
+    assert response.status_code == 500
+    assert response.json()["detail"].startswith("Database error:")
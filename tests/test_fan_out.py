@@ -0,0 +1,52 @@
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from tests.conftest import sqlite_engine, fill_source
+from utils.checkpoints import ensure_checkpoint_table
+from utils.fan_out import FanOutTarget, fan_out_known_tables
+from utils.handle_functions import reflect_metadata
+from utils.models import User
+
+POSTS = "SELECT p.title, u.email FROM posts p JOIN users u ON u.id = p.author_id ORDER BY p.title"
+
+
+class Engine:
+    def __init__(self, engine):
+        self.engine = engine
+
+
+def rows(engine, query):
+    with engine.connect() as conn:
+        return conn.execute(text(query)).fetchall()
+
+
+def test_every_target_gets_the_source_with_its_own_ids(source_engine, tmp_path):
+    fill_source(source_engine)
+    metadata = reflect_metadata(Engine(source_engine))
+    targets = {}
+    for name in ("first", "second", "broken"):
+        targets[name] = sqlite_engine(tmp_path / f"{name}.db")
+        if name != "broken":
+            metadata.create_all(targets[name])
+            ensure_checkpoint_table(targets[name])
+    # The second target already has users, so its rows are numbered differently.
+    with targets["second"].begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": i, "name": "there", "email": f"other{i}@example.com", "city": "Nice"} for i in range(1, 31)
+        ])
+
+    fan_out_targets = [FanOutTarget(name, sessionmaker(bind=engine), {}) for name, engine in targets.items()]
+    inserted = fan_out_known_tables(
+        sessionmaker(bind=source_engine), fan_out_targets, metadata, chunk_size=7, source_key="source"
+    )
+
+    expected = {"users": 20, "products": 5, "posts": 60, "comments": 120}
+    assert inserted["first"] == expected
+    assert inserted["second"] == expected
+    assert fan_out_targets[2].error["table"] in expected
+    for name in ("first", "second"):
+        assert rows(targets[name], POSTS) == rows(source_engine, POSTS)
+    assert rows(targets["second"], "SELECT MIN(users.id) FROM users WHERE email LIKE 'user%'") == [(31,)]
+
+    for engine in targets.values():
+        engine.dispose()
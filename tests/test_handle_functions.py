@@ -0,0 +1,96 @@
+from sqlalchemy import MetaData, Table, Column, Integer, String, ForeignKey, event, text
+from sqlalchemy.orm import sessionmaker
+
+from database.source_db import Base
+from tests.conftest import sqlite_engine
+from utils.checkpoints import ensure_checkpoint_table
+from utils.handle_functions import (
+    migrate_known_tables, reflect_metadata, table_handler, prepare_users, prepare_posts, prepare_table
+)
+from utils.sql_copy import SqlCopy
+
+
+class Engine:
+    def __init__(self, engine):
+        self.engine = engine
+
+
+def other_schema():
+    """A users table without email, referenced by a table the handlers don't know."""
+    metadata = MetaData()
+    Table("users", metadata, Column("id", Integer, primary_key=True), Column("username", String(50)))
+    Table(
+        "orders", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id")),
+        Column("total", Integer),
+    )
+    return metadata
+
+
+def fill_other(engine):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username) VALUES (1, 'ann'), (2, 'bob')"))
+        conn.execute(text("INSERT INTO orders (id, user_id, total) VALUES (1, 1, 10), (2, 2, 20), (3, 2, 30)"))
+
+
+ORDERS = "SELECT o.total, u.username FROM orders o JOIN users u ON u.id = o.user_id ORDER BY o.total"
+
+
+def rows(engine, query):
+    with engine.connect() as conn:
+        return conn.execute(text(query)).fetchall()
+
+
+def test_handlers_are_used_only_for_tables_of_their_shape():
+    assert table_handler(Base.metadata.tables["users"])[0] is prepare_users
+    assert table_handler(Base.metadata.tables["posts"])[0] is prepare_posts
+
+    metadata = other_schema()
+    assert table_handler(metadata.tables["users"])[0] is prepare_table
+    assert table_handler(metadata.tables["orders"])[0] is prepare_table
+
+    Table(
+        "posts", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("author_id", Integer, ForeignKey("users.id")),
+        Column("order_id", Integer, ForeignKey("orders.id")),
+    )
+    assert table_handler(metadata.tables["posts"])[0] is prepare_table
+
+
+def test_tables_named_like_known_ones_migrate_by_their_metadata(tmp_path):
+    source, target = sqlite_engine(tmp_path / "source.db"), sqlite_engine(tmp_path / "target.db")
+    other_schema().create_all(source)
+    fill_other(source)
+    metadata = reflect_metadata(Engine(source))
+    metadata.create_all(target)
+    with target.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username) VALUES (1, 'existing')"))
+
+    inserted = migrate_known_tables(sessionmaker(bind=source), sessionmaker(bind=target), metadata)
+
+    assert inserted == {"users": 2, "orders": 3}
+    assert rows(target, ORDERS) == rows(source, ORDERS)
+
+
+def test_sql_copy_skips_the_natural_key_of_tables_without_it(tmp_path):
+    source, target = sqlite_engine(tmp_path / "source.db"), sqlite_engine(tmp_path / "target.db")
+
+    # SQLite reads the source through an attached database, as SQL Server
+    # would through [source_db].[dbo].
+    @event.listens_for(target, "connect")
+    def attach(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE '{tmp_path / 'source.db'}' AS src")
+
+    other_schema().create_all(source)
+    fill_other(source)
+    metadata = reflect_metadata(Engine(source))
+    metadata.create_all(target)
+    ensure_checkpoint_table(target)
+    inserted = migrate_known_tables(
+        sessionmaker(bind=source), sessionmaker(bind=target), metadata, source_key="source", sql_copy=SqlCopy("src")
+    )
+
+    assert inserted == {"users": 2, "orders": 3}
+    assert rows(target, ORDERS) == rows(source, ORDERS)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.id_map import IdMap
+
+
+def test_lookup_finds_added_ids():
+    id_map = IdMap()
+    id_map.add([5, 1], [105, 101])
+    id_map.add([3], [103])
+
+    targets, found = id_map.lookup([1, 2, 3, 5, 9])
+
+    assert len(id_map) == 3
+    assert found.tolist() == [True, False, True, True, False]
+    assert targets[found].tolist() == [101, 103, 105]
+
+
+def test_lookup_on_an_empty_map_finds_nothing():
+    targets, found = IdMap().lookup(np.array([1, 2]))
+    assert not found.any()
+    assert targets.tolist() == [0, 0]
+
+
+def test_remap_keeps_nulls_and_flags_unknown_values():
+    id_map = IdMap()
+    id_map.add([1, 2], [11, 12])
+
+    mapped, found = id_map.remap(pd.Series([2, None, 7, 1]))
+
+    assert mapped.isna().tolist() == [False, True, False, False]
+    assert mapped[[0, 3]].tolist() == [12, 11]
+    assert found.tolist() == [True, True, False, True]
+
+
+def test_copy_does_not_see_later_adds():
+    id_map = IdMap(offset=40)
+    id_map.add([1], [41])
+    copied = id_map.copy()
+    id_map.add([2], [42])
+
+    assert copied.offset == 40
+    assert copied.lookup([1, 2])[1].tolist() == [True, False]
+    assert id_map.lookup([1, 2])[1].tolist() == [True, True]
+
+
+def test_add_rejects_arrays_of_different_lengths():
+    with pytest.raises(ValueError):
+        IdMap().add([1, 2], [3])
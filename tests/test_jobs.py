@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from utils.jobs import JobManager, job_manager, QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED
+
+
+def wait_for(job, states=(COMPLETED, FAILED, CANCELLED), timeout=5):
+    deadline = time.time() + timeout
+    while job.state not in states:
+        assert time.time() < deadline, f"job still {job.state}"
+        time.sleep(0.01)
+    return job
+
+
+def blocked(release):
+    def run(job=None):
+        while not release.wait(0.01):
+            job.check_cancelled()
+        return "done"
+    return run
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(workers=2, queue_limit=2, per_database=1)
+    yield manager
+    manager.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def test_job_runs_and_keeps_its_result(manager):
+    job = manager.submit("test", "db", lambda value, job=None: value * 2, 21)
+    assert wait_for(job).state == COMPLETED
+    assert job.result == 42
+
+
+def test_failed_job_keeps_its_error(manager):
+    def fail(job=None):
+        raise ValueError("broken")
+
+    job = wait_for(manager.submit("test", "db", fail))
+    assert job.state == FAILED
+    assert job.error["type"] == "ValueError"
+    assert job.error["message"] == "broken"
+
+
+def test_jobs_on_the_same_database_wait_for_each_other(manager):
+    release = threading.Event()
+    first = manager.submit("test", "db", blocked(release))
+    second = manager.submit("test", "db", blocked(release))
+    other = manager.submit("test", "other", blocked(release))
+
+    wait_for(other, (RUNNING,))
+    assert first.state == RUNNING
+    assert second.state == QUEUED
+
+    release.set()
+    assert wait_for(second).state == COMPLETED
+
+
+def test_cancel_stops_running_and_queued_jobs(manager):
+    cleaned = []
+    running = manager.submit("test", "db", blocked(threading.Event()))
+    queued = manager.submit("test", "db", blocked(threading.Event()), cleanup=lambda: cleaned.append(True))
+
+    manager.cancel(queued.id)
+    manager.cancel(running.id)
+
+    assert queued.state == CANCELLED
+    assert cleaned == [True]
+    assert wait_for(running).state == CANCELLED
+
+
+def test_full_queue_is_refused(manager):
+    release = threading.Event()
+    for _ in range(3):
+        manager.submit("test", "db", blocked(release))
+    with pytest.raises(Exception, match="queue is full"):
+        manager.submit("test", "db", blocked(release))
+    release.set()
+
+
+def test_jobs_routes_report_and_cancel_jobs():
+    client = TestClient(app)
+    release = threading.Event()
+    job = job_manager.submit("test", "jobs-route-db", blocked(release))
+    try:
+        response = client.get(f"/jobs/{job.id}")
+        assert response.status_code == 200
+        assert response.json()["job_id"] == job.id
+
+        response = client.post(f"/jobs/{job.id}/cancel")
+        assert response.status_code == 200
+        assert response.json()["cancel_requested"]
+        assert wait_for(job).state == CANCELLED
+    finally:
+        release.set()
+
+    assert client.get("/jobs/unknown").status_code == 404
+    assert client.post("/jobs/unknown/cancel").status_code == 404
@@ -0,0 +1,56 @@
+import pandas as pd
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from database.engine_registry import EngineRegistry
+from main import app
+from utils.jobs import Job
+from utils.metrics import Metrics, metrics, PARSE
+
+
+def test_stages_add_up_in_totals_and_on_the_job():
+    stage_metrics = Metrics()
+    job = Job("test", "db", None, ())
+
+    with stage_metrics.timer(PARSE, job) as timer:
+        timer.rows = 10
+    frames = [pd.DataFrame({"a": [1, 2]}), pd.DataFrame({"a": [3]})]
+    assert len(list(stage_metrics.timed_batches(frames, PARSE, job))) == 2
+
+    calls, _, rows, size = stage_metrics.stages[PARSE]
+    assert (calls, rows) == (3, 13)
+    assert size > 0
+    assert job.to_dict()["metrics"][PARSE]["rows"] == 13
+
+
+def test_render_uses_the_prometheus_text_format():
+    stage_metrics = Metrics()
+    stage_metrics.observe(PARSE, 0.5, rows=4)
+    stage_metrics.observe_statement("db", "  select 1", 0.25)
+
+    rendered = stage_metrics.render({"running": 1}).splitlines()
+
+    assert "# TYPE dbapp_stage_rows_total counter" in rendered
+    assert 'dbapp_stage_rows_total{stage="parse"} 4' in rendered
+    assert 'dbapp_db_statements_total{database="db",statement="SELECT"} 1' in rendered
+    assert 'dbapp_jobs{state="running"} 1' in rendered
+
+
+def test_registry_engines_count_their_statements(tmp_path):
+    registry = EngineRegistry()
+    engine = registry.get_engine(f"sqlite:///{tmp_path / 'counted.db'}")
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    finally:
+        registry.dispose_all()
+
+    assert f'database="{tmp_path / "counted.db"}",statement="SELECT"' in metrics.render()
+
+
+def test_metrics_route_serves_the_totals_and_job_states():
+    response = TestClient(app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE dbapp_jobs gauge" in response.text
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+from utils.pipeline import pipelined, fan_out
+
+
+def test_pipelined_applies_the_stages_in_order():
+    results = list(pipelined(range(20), lambda x: x + 1, lambda x: x * 10, queue_size=2))
+    assert results == [(x + 1) * 10 for x in range(20)]
+
+
+def test_pipelined_reraises_a_stage_error():
+    def stage(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    with pytest.raises(ValueError, match="bad item"):
+        list(pipelined(range(10), stage))
+
+
+def test_pipelined_reraises_an_error_of_the_items():
+    def items():
+        yield 1
+        raise RuntimeError("source failed")
+
+    with pytest.raises(RuntimeError, match="source failed"):
+        list(pipelined(items(), lambda x: x))
+
+
+def test_closing_pipelined_early_stops_its_threads():
+    before = threading.active_count()
+    results = pipelined(iter(range(1000)), lambda x: x, queue_size=1)
+    assert next(results) == 0
+    results.close()
+    assert threading.active_count() == before
+
+
+def test_fan_out_feeds_every_consumer_every_item():
+    results = fan_out(range(50), [sum, lambda items: [x * 2 for x in items]], queue_size=3)
+    assert results == [(sum(range(50)), None), ([x * 2 for x in range(50)], None)]
+
+
+def test_fan_out_keeps_feeding_the_others_when_one_fails():
+    def failing(items):
+        for item in items:
+            if item == 5:
+                raise ValueError("consumer failed")
+
+    results = fan_out(range(100), [failing, sum], queue_size=1)
+
+    assert results[0][0] is None
+    assert isinstance(results[0][1], ValueError)
+    assert results[1] == (sum(range(100)), None)
+
+
+def test_fan_out_raises_an_error_of_the_items():
+    def items():
+        yield 1
+        raise RuntimeError("source failed")
+
+    seen = []
+
+    def consumer(received):
+        for item in received:
+            seen.append(item)
+
+    with pytest.raises(RuntimeError, match="source failed"):
+        fan_out(items(), [consumer])
+    assert seen == [1]
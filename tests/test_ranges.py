@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import routers.index
+from main import app
+from utils.handle_functions import RangeBudget, max_range_workers
+
+
+def test_budget_gives_what_is_free_up_to_what_is_asked():
+    budget = RangeBudget(5)
+    assert budget.acquire(3) == 3
+    assert budget.acquire(3) == 2
+    budget.release(3)
+    assert budget.acquire(8) == 3
+
+
+def test_budget_makes_tables_wait_for_a_slot():
+    budget = RangeBudget(1)
+    budget.acquire(1)
+    taken = []
+    waiting = threading.Thread(target=lambda: taken.append(budget.acquire(2)))
+    waiting.start()
+    waiting.join(0.2)
+    assert taken == []
+
+    budget.release(1)
+    waiting.join(1)
+    assert taken == [1]
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    jobs = []
+
+    def submit(kind, target_db, func, *args, cleanup=None):
+        jobs.append(args)
+        return type("Job", (), {"id": "job"})()
+
+    monkeypatch.setattr(routers.index.job_manager, "submit", submit)
+    return jobs
+
+
+def test_migrate_accepts_range_workers_with_the_default_pool(submitted):
+    assert max_range_workers() > 1
+    response = TestClient(app).post(
+        "/migrate_data", data={"source_db": "source", "target_db": "target", "range_workers": "2"}
+    )
+    assert response.status_code == 200
+    assert submitted[0][2] == 2
+
+
+def test_migrate_rejects_more_range_workers_than_the_pool_fits(submitted):
+    response = TestClient(app).post(
+        "/migrate_data",
+        data={"source_db": "source", "target_db": "target", "range_workers": str(max_range_workers() + 1)}
+    )
+    assert response.status_code == 400
+    assert submitted == []
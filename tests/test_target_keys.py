@@ -0,0 +1,93 @@
+from functools import partial
+
+import pandas as pd
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import sessionmaker
+
+import utils.handle_functions
+from tests.conftest import fill_source
+from utils.handle_functions import migrate_known_tables, reflect_metadata
+from utils.models import User, Product
+from utils.target_keys import TargetKeys
+
+users = User.__table__
+
+
+def add_users(session, *emails):
+    session.execute(users.insert(), [
+        {"id": 10 + position, "name": email, "email": email, "city": "Lyon"} for position, email in enumerate(emails)
+    ])
+    session.commit()
+
+
+def staged(session):
+    keys = TargetKeys(session, users.c.email, users.c.id, max_in_memory_rows=0)
+    assert keys.known is None
+    return keys
+
+
+def test_staged_lookup_matches_keys_in_the_database(target_session):
+    add_users(target_session, "a@example.com", "b@example.com")
+    keys = staged(target_session)
+
+    matched = keys.match(target_session, pd.Series(["b@example.com", "c@example.com", None, "b@example.com"]))
+
+    assert matched.to_dict() == {"b@example.com": 11}
+    assert keys.contains(target_session, pd.Series(["a@example.com", "c@example.com"])).tolist() == [True, False]
+
+
+def test_staged_lookup_of_only_nulls_matches_nothing(target_session):
+    add_users(target_session, "a@example.com")
+    keys = staged(target_session)
+    assert keys.match(target_session, pd.Series([None], dtype=object)).empty
+
+
+def test_staged_lookup_drops_its_staging_table(target_session):
+    add_users(target_session, "a@example.com")
+    keys = staged(target_session)
+    keys.match(target_session, pd.Series(["a@example.com"]))
+
+    temp_tables = inspect(target_session.connection()).get_temp_table_names()
+    assert temp_tables == []
+
+
+def test_migration_matches_existing_users_through_staged_lookups(monkeypatch, source_engine, target_engine):
+    monkeypatch.setattr(utils.handle_functions, "TargetKeys", partial(TargetKeys, max_in_memory_rows=0))
+    fill_source(source_engine)
+    with target_engine.begin() as conn:
+        conn.execute(users.insert().values(id=1, name="kept", email="user3@example.com", city="Nice"))
+
+    class Engine:
+        engine = source_engine
+
+    metadata = reflect_metadata(Engine())
+    inserted = migrate_known_tables(
+        sessionmaker(bind=source_engine), sessionmaker(bind=target_engine), metadata, chunk_size=7
+    )
+
+    assert inserted["users"] == 19
+    query = "SELECT p.title, u.email FROM posts p JOIN users u ON u.id = p.author_id ORDER BY p.title"
+    with source_engine.connect() as source, target_engine.connect() as target:
+        assert target.execute(text(query)).fetchall() == source.execute(text(query)).fetchall()
+
+
+def test_products_are_numbered_above_the_target_without_key_lookups(monkeypatch, source_engine, target_engine):
+    lookups = []
+    monkeypatch.setattr(utils.handle_functions, "TargetKeys", lambda *args, **kwargs: lookups.append(args))
+    with source_engine.begin() as conn:
+        conn.execute(Product.__table__.insert(), [
+            {"id": i, "name": f"product {i}", "price": i, "description": "thing"} for i in range(1, 6)
+        ])
+    with target_engine.begin() as conn:
+        conn.execute(text("INSERT INTO products (id, name, price, description) VALUES (3, 'existing', 1, 'x')"))
+
+    class Engine:
+        engine = source_engine
+
+    metadata = reflect_metadata(Engine(), ["products"])
+    inserted = migrate_known_tables(sessionmaker(bind=source_engine), sessionmaker(bind=target_engine), metadata)
+
+    assert inserted == {"products": 5}
+    assert lookups == []
+    with target_engine.connect() as conn:
+        assert conn.execute(text("SELECT id FROM products ORDER BY id")).scalars().all() == [3, 4, 5, 6, 7, 8]
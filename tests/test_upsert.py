@@ -0,0 +1,87 @@
+import pandas as pd
+from sqlalchemy import select
+
+from utils.models import User, Post
+from utils.upsert import upsert_frame
+
+users = User.__table__
+posts = Post.__table__
+
+
+def add_user(session, email, name="old", city="Paris"):
+    session.execute(users.insert().values(name=name, email=email, city=city))
+    session.commit()
+
+
+def users_by_email(session):
+    return {row.email: (row.name, row.city) for row in session.execute(select(users))}
+
+
+def test_inserts_new_rows_and_updates_existing_ones(target_session):
+    add_user(target_session, "a@example.com")
+    frame = pd.DataFrame({
+        "name": ["new a", "b"],
+        "email": ["a@example.com", "b@example.com"],
+        "city": ["Lyon", "Nice"],
+    })
+
+    counts = upsert_frame(target_session, users, frame, ["email"])
+    target_session.commit()
+
+    assert counts == {"inserted": 1, "updated": 1, "skipped": 0, "invalid_keys": []}
+    assert users_by_email(target_session) == {"a@example.com": ("new a", "Lyon"), "b@example.com": ("b", "Nice")}
+
+
+def test_later_rows_win_over_earlier_ones_with_the_same_key(target_session):
+    frame = pd.DataFrame({
+        "name": ["first", "second"],
+        "email": ["a@example.com", "a@example.com"],
+        "city": ["Lyon", "Nice"],
+    })
+
+    counts = upsert_frame(target_session, users, frame, ["email"])
+    target_session.commit()
+
+    assert counts["inserted"] == 1
+    assert counts["updated"] == 1
+    assert users_by_email(target_session) == {"a@example.com": ("second", "Nice")}
+
+
+def test_without_updates_existing_rows_are_skipped(target_session):
+    add_user(target_session, "a@example.com")
+    frame = pd.DataFrame({
+        "name": ["new a", "b"],
+        "email": ["a@example.com", "b@example.com"],
+        "city": ["Lyon", "Nice"],
+    })
+
+    counts = upsert_frame(target_session, users, frame, ["email"], update_existing=False)
+    target_session.commit()
+
+    assert counts == {"inserted": 1, "updated": 0, "skipped": 1, "invalid_keys": []}
+    assert users_by_email(target_session)["a@example.com"] == ("old", "Paris")
+
+
+def test_rows_with_unknown_parents_are_skipped(target_session):
+    add_user(target_session, "a@example.com")
+    author_id = target_session.execute(select(users.c.id)).scalar()
+    frame = pd.DataFrame({
+        "title": ["kept", "orphan"],
+        "content": ["text", "text"],
+        "author_id": [author_id, author_id + 100],
+    })
+
+    counts = upsert_frame(
+        target_session, posts, frame, ["title"], foreign_key=("author_id", users)
+    )
+    target_session.commit()
+
+    assert counts["inserted"] == 1
+    assert counts["skipped"] == 1
+    assert counts["invalid_keys"] == [author_id + 100]
+    assert [row.title for row in target_session.execute(select(posts))] == ["kept"]
+
+
+def test_empty_frame_changes_nothing(target_session):
+    counts = upsert_frame(target_session, users, pd.DataFrame(), ["email"])
+    assert counts == {"inserted": 0, "updated": 0, "skipped": 0, "invalid_keys": []}
@@ -0,0 +1,82 @@
+import pandas as pd
+
+from utils.models import User, Comment
+from utils.schemas import UserCreate, CommentCreate
+from utils.validation import RejectReport, validate_frame
+
+
+def validate(df, schema, table, key_columns, update_existing=True):
+    report = RejectReport()
+    clean = validate_frame(df, schema, table, key_columns, report, update_existing=update_existing)
+    return clean, report
+
+
+def test_clean_rows_are_coerced_and_kept():
+    frame = pd.DataFrame({"post_id": ["1", 2.0], "text": ["hi", 5], "commenter_name": ["a", "b"]})
+
+    clean, report = validate(frame, CommentCreate, Comment.__table__, ["post_id", "text"])
+
+    assert report.rejected == 0
+    assert clean["post_id"].tolist() == [1, 2]
+    assert clean["text"].tolist() == ["hi", "5"]
+
+
+def test_bad_rows_are_reported_with_their_sheet_row():
+    frame = pd.DataFrame({
+        "post_id": [1, "x", 2.5, 3, 2 ** 31],
+        "text": ["ok", "a", "b", None, "c"],
+        "commenter_name": ["n", "n", "n", "n", "n" * 51],
+    })
+
+    clean, report = validate(frame, CommentCreate, Comment.__table__, ["post_id", "text"])
+
+    assert clean["post_id"].tolist() == [1]
+    assert report.rejected == 4
+    assert report.reasons == {
+        "post_id: not a whole number in INT range": 3,
+        "text: is required": 1,
+    }
+    assert [sample["row"] for sample in report.samples] == [3, 4, 6, 5]
+
+
+def test_missing_required_column_rejects_every_row():
+    frame = pd.DataFrame({"name": ["a"], "email": ["a@example.com"]})
+
+    clean, report = validate(frame, UserCreate, User.__table__, ["email"])
+
+    assert clean.empty
+    assert report.reasons == {"city: column is missing": 1}
+
+
+def test_duplicate_keys_keep_the_last_row_when_updating():
+    frame = pd.DataFrame({
+        "name": ["first", "second"], "email": ["a@example.com", "a@example.com"], "city": ["Lyon", "Nice"]
+    })
+
+    clean, report = validate(frame, UserCreate, User.__table__, ["email"])
+
+    assert clean["name"].tolist() == ["second"]
+    assert report.reasons == {"email: duplicate key, a later row replaces it": 1}
+    assert report.samples[0]["row"] == 2
+
+
+def test_duplicate_keys_keep_the_first_row_without_updates():
+    frame = pd.DataFrame({
+        "post_id": [1, 1], "text": ["same", "same"], "commenter_name": ["first", "second"]
+    })
+
+    clean, report = validate(frame, CommentCreate, Comment.__table__, ["post_id", "text"], update_existing=False)
+
+    assert clean["commenter_name"].tolist() == ["first"]
+    assert report.reasons == {"post_id, text: duplicate of an earlier row": 1}
+    assert report.samples[0]["row"] == 3
+
+
+def test_sample_size_limits_the_kept_samples_not_the_counts():
+    frame = pd.DataFrame({"post_id": ["x"] * 5, "text": ["t"] * 5, "commenter_name": ["n"] * 5})
+    report = RejectReport(sample_size=2)
+
+    validate_frame(frame, CommentCreate, Comment.__table__, ["post_id", "text"], report)
+
+    assert report.rejected == 5
+    assert len(report.samples) == 2
@@ -0,0 +1,143 @@
+import os
+import threading
+from collections import Counter
+from sqlalchemy.exc import DBAPIError
+
+ADAPTIVE_BATCH_SIZE = os.getenv("ADAPTIVE_BATCH_SIZE", "1") == "1"
+ADAPTIVE_BATCH_MIN = int(os.getenv("ADAPTIVE_BATCH_MIN", "100"))
+ADAPTIVE_BATCH_MAX = int(os.getenv("ADAPTIVE_BATCH_MAX", "100000"))
+ADAPTIVE_BATCH_MAX_SECONDS = float(os.getenv("ADAPTIVE_BATCH_MAX_SECONDS", "5"))
+ADAPTIVE_BATCH_RETRIES = int(os.getenv("ADAPTIVE_BATCH_RETRIES", "5"))
+
+PARAMETER_LIMIT = "parameter_limit"
+LOCK_TIMEOUT = "lock_timeout"
+LOG_FULL = "log_full"
+SLOW_BATCH = "slow_batch"
+
+# Matched against the driver's message. SQL Server: 8003 / 2100 parameters,
+# 1222 lock timeout, 1205 deadlock, 9002 log full. SQLite has its own wording.
+ERROR_SIGNALS = {
+    PARAMETER_LIMIT: ("too many parameters", "(8003)", "too many sql variables"),
+    LOCK_TIMEOUT: ("lock request time out", "(1222)", "deadlock", "(1205)", "database is locked"),
+    LOG_FULL: ("transaction log for database", "(9002)"),
+}
+
+
+def error_signal(error):
+    """Return which back-off signal a database error is, or None if a smaller batch won't help."""
+    if not isinstance(error, DBAPIError):
+        return None
+    message = str(error.orig).lower()
+    for signal, patterns in ERROR_SIGNALS.items():
+        if any(pattern in message for pattern in patterns):
+            return signal
+    return None
+
+
+class BatchSizer:
+    """Picks the batch size of a writer from how its batches perform.
+
+    Batches are measured in windows of a few. While throughput (rows per
+    second over the window) keeps improving by more than tolerance the
+    size doubles; once it stops, the best size seen is kept. A batch
+    slower than max_seconds, or a parameter-limit, lock-timeout or
+    log-full error reported through back_off(), halves the size and caps
+    growth there. Shared by the threads writing one table, so it locks.
+    """
+
+    def __init__(self, initial, minimum=ADAPTIVE_BATCH_MIN, maximum=ADAPTIVE_BATCH_MAX,
+                 max_seconds=ADAPTIVE_BATCH_MAX_SECONDS, window=3, tolerance=0.05):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.initial = min(max(initial, minimum), self.maximum)
+        self.max_seconds = max_seconds
+        self.window = window
+        self.tolerance = tolerance
+        self.size = self.initial
+        self.ceiling = self.maximum
+        self.growing = True
+        self.best_size = self.initial
+        self.best_rate = 0.0
+        self.window_rows = 0
+        self.window_seconds = 0.0
+        self.window_batches = 0
+        self.batches = 0
+        self.sizes = [self.initial]
+        self.signals = Counter()
+        self.lock = threading.Lock()
+
+    def _resize(self, size):
+        self.size = min(max(size, self.minimum), self.ceiling)
+        if self.size != self.sizes[-1]:
+            self.sizes.append(self.size)
+        self.window_rows = 0
+        self.window_seconds = 0.0
+        self.window_batches = 0
+
+    def _shrink(self, signal):
+        self.signals[signal] += 1
+        self.growing = False
+        self.ceiling = max(self.minimum, self.size // 2)
+        self.best_size = min(self.best_size, self.ceiling)
+        self._resize(self.ceiling)
+
+    def observe(self, rows, seconds):
+        with self.lock:
+            self.batches += 1
+            if seconds > self.max_seconds and self.size > self.minimum:
+                self._shrink(SLOW_BATCH)
+                return
+
+            self.window_rows += rows
+            self.window_seconds += seconds
+            self.window_batches += 1
+            if not self.growing or self.window_batches < self.window:
+                return
+
+            rate = self.window_rows / self.window_seconds if self.window_seconds else 0.0
+            if rate > self.best_rate * (1 + self.tolerance):
+                self.best_rate = rate
+                self.best_size = self.size
+                if self.size < self.ceiling:
+                    self._resize(self.size * 2)
+                    return
+            self.growing = False
+            self._resize(self.best_size)
+
+    def back_off(self, signal):
+        """Shrink after an error; return False when already at the minimum."""
+        with self.lock:
+            if self.size <= self.minimum:
+                return False
+            self._shrink(signal)
+            return True
+
+    def report(self):
+        with self.lock:
+            return {
+                "initial": self.initial,
+                "final": self.size,
+                "best_rows_per_second": self.best_rate,
+                "batches": self.batches,
+                "sizes": list(self.sizes),
+                "signals": dict(self.signals),
+            }
+
+
+def with_back_off(sizer, attempt, rollback, retries=ADAPTIVE_BATCH_RETRIES):
+    """Run attempt(); on an error a smaller batch can fix, roll back, shrink and try again.
+
+    attempt must write and commit a unit of work on its own, so a rollback
+    never loses anything committed before it.
+    """
+    for tries in range(retries + 1):
+        try:
+            return attempt()
+        except DBAPIError as e:
+            signal = error_signal(e)
+            if sizer is None or signal is None or tries == retries:
+                raise
+            rollback()
+            if not sizer.back_off(signal):
+                raise
+            print(f"Batch failed ({signal}), retrying with batches of {sizer.size}: {str(e.orig)}")
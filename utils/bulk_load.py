@@ -0,0 +1,148 @@
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+from sqlalchemy import text
+
+from utils.bulk_writer import TABLOCK
+
+BULK_LOAD_MODE = os.getenv("BULK_LOAD_MODE", "0") == "1"
+ORPHAN_SAMPLE_SIZE = int(os.getenv("ORPHAN_SAMPLE_SIZE", "10"))
+
+
+class BulkLoad:
+    """Defers index and foreign-key maintenance on target tables during a load.
+
+    On SQL Server, begin() disables the non-unique nonclustered indexes and
+    the foreign keys of the given tables, and sessions from
+    session_factory() insert WITH (TABLOCK). finish() rebuilds the indexes
+    and turns the foreign keys back on WITH CHECK. A foreign key that has
+    orphaned rows cannot be trusted, so it is re-enabled WITH NOCHECK
+    instead (new writes are checked again) and the orphans are reported.
+    Unique indexes are left alone since the loaders rely on them. Other
+    databases load as usual.
+    """
+
+    def __init__(self, engine, table_names):
+        self.engine = engine
+        self.table_names = list(table_names)
+        self.active = engine.dialect.name == "mssql"
+        self.disabled_indexes = []
+        self.disabled_foreign_keys = []
+        self.report = {
+            "enabled": self.active,
+            "disabled_indexes": 0,
+            "disabled_foreign_keys": 0,
+            "orphans": {},
+            "untrusted_foreign_keys": [],
+        }
+
+    def _qualified(self, table_name):
+        return f"[dbo].[{table_name}]"
+
+    def begin(self):
+        if not self.active:
+            return
+
+        # Recorded only once the transaction commits, so a failed begin()
+        # leaves nothing for finish() to undo.
+        disabled_indexes = []
+        disabled_foreign_keys = []
+        with self.engine.begin() as conn:
+            for table_name in self.table_names:
+                object_id = {"table_name": f"dbo.{table_name}"}
+                indexes = conn.execute(text(
+                    "SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID(:table_name) "
+                    "AND type = 2 AND is_unique = 0 AND is_primary_key = 0 AND is_disabled = 0"
+                ), object_id).scalars().all()
+                foreign_keys = conn.execute(text(
+                    "SELECT name FROM sys.foreign_keys WHERE parent_object_id = OBJECT_ID(:table_name) "
+                    "AND is_disabled = 0"
+                ), object_id).scalars().all()
+
+                for name in indexes:
+                    conn.execute(text(f"ALTER INDEX [{name}] ON {self._qualified(table_name)} DISABLE"))
+                    disabled_indexes.append((table_name, name))
+                for name in foreign_keys:
+                    conn.execute(text(f"ALTER TABLE {self._qualified(table_name)} NOCHECK CONSTRAINT [{name}]"))
+                    disabled_foreign_keys.append((table_name, name))
+
+        self.disabled_indexes = disabled_indexes
+        self.disabled_foreign_keys = disabled_foreign_keys
+
+        self.report["disabled_indexes"] = len(self.disabled_indexes)
+        self.report["disabled_foreign_keys"] = len(self.disabled_foreign_keys)
+        print(f"Bulk load: disabled {len(self.disabled_indexes)} indexes and "
+              f"{len(self.disabled_foreign_keys)} foreign keys")
+
+    def session_factory(self, session_factory):
+        if not self.active:
+            return session_factory
+
+        def factory():
+            session = session_factory()
+            session.info[TABLOCK] = True
+            return session
+
+        return factory
+
+    def _find_orphans(self, conn, table_name):
+        # DBCC CHECKCONSTRAINTS returns one row per violating row, with the
+        # constraint name and a WHERE clause that selects it.
+        violations = defaultdict(list)
+        rows = conn.execute(text(
+            f"DBCC CHECKCONSTRAINTS ('{self._qualified(table_name)}') WITH ALL_CONSTRAINTS, NO_INFOMSGS"
+        )).fetchall()
+        for row in rows:
+            violations[row[1].strip("[]")].append(row[2])
+        return violations
+
+    def finish(self):
+        if not self.active:
+            return self.report
+
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for table_name, name in self.disabled_indexes:
+                conn.execute(text(f"ALTER INDEX [{name}] ON {self._qualified(table_name)} REBUILD"))
+
+            for table_name in dict.fromkeys(table_name for table_name, _ in self.disabled_foreign_keys):
+                violations = self._find_orphans(conn, table_name)
+
+                for fk_table, name in self.disabled_foreign_keys:
+                    if fk_table != table_name:
+                        continue
+
+                    if violations.get(name):
+                        conn.execute(text(
+                            f"ALTER TABLE {self._qualified(table_name)} WITH NOCHECK CHECK CONSTRAINT [{name}]"
+                        ))
+                        self.report["orphans"][f"{table_name}.{name}"] = {
+                            "rows": len(violations[name]),
+                            "sample": violations[name][:ORPHAN_SAMPLE_SIZE],
+                        }
+                        self.report["untrusted_foreign_keys"].append(f"{table_name}.{name}")
+                    else:
+                        conn.execute(text(
+                            f"ALTER TABLE {self._qualified(table_name)} WITH CHECK CHECK CONSTRAINT [{name}]"
+                        ))
+
+        print(f"Bulk load: rebuilt {len(self.disabled_indexes)} indexes, "
+              f"orphaned rows: {self.report['orphans'] or 'none'}")
+        return self.report
+
+
+@contextmanager
+def bulk_load(engine, table_names, enabled=BULK_LOAD_MODE):
+    """Yield a started BulkLoad, or None when bulk-load mode is off.
+
+    Indexes and foreign keys are restored even when the load fails.
+    """
+    if not enabled:
+        yield None
+        return
+
+    load = BulkLoad(engine, table_names)
+    load.begin()
+    try:
+        yield load
+    finally:
+        load.finish()
@@ -0,0 +1,75 @@
+import os
+import time
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+
+# Session.info flag set by bulk-load mode: inserts into target tables take a
+# table lock, which lets SQL Server minimally log them.
+TABLOCK = "tablock"
+
+
+def engine_options(db_url):
+    # pyodbc sends an executemany as one parameter array instead of one
+    # round trip per row when fast_executemany is on. Other drivers (SQLite
+    # in local runs) don't know the flag, so only pass it for mssql+pyodbc.
+    if db_url.startswith("mssql+pyodbc"):
+        return {"fast_executemany": True}
+    return {}
+
+
+def insert_statement(session, table):
+    statement = table.insert()
+    if session.info.get(TABLOCK):
+        statement = statement.with_hint("WITH (TABLOCK)", dialect_name="mssql")
+    return statement
+
+
+class BulkWriter:
+    def __init__(self, session, table, batch_size=BULK_BATCH_SIZE, commit=True, sizer=None):
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least 1")
+
+        self.session = session
+        self.table = table
+        self._batch_size = batch_size
+        self.commit = commit
+        # A BatchSizer, when given, picks the size of every batch instead.
+        self.sizer = sizer
+        self.pending = []
+        self.inserted = 0
+        self.batches = 0
+
+    @property
+    def batch_size(self):
+        return self.sizer.size if self.sizer is not None else self._batch_size
+
+    def write(self, rows):
+        self.pending.extend(rows)
+        while len(self.pending) >= (batch_size := self.batch_size):
+            batch = self.pending[:batch_size]
+            self.pending = self.pending[batch_size:]
+            self._send(batch)
+
+    def flush(self):
+        if self.pending:
+            batch = self.pending
+            self.pending = []
+            self._send(batch)
+        return self.inserted
+
+    def _send(self, batch):
+        started = time.perf_counter()
+        try:
+            self.session.execute(insert_statement(self.session, self.table), batch)
+            if self.commit:
+                self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+
+        if self.sizer is not None:
+            self.sizer.observe(len(batch), time.perf_counter() - started)
+
+        self.inserted += len(batch)
+        self.batches += 1
+
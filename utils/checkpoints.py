@@ -0,0 +1,113 @@
+from datetime import datetime, timezone
+import numpy as np
+from sqlalchemy import MetaData, Table, Column, String, Integer, BigInteger, DateTime, select, update
+from database.schema_bootstrap import schema_bootstrap
+
+CHECKPOINT_TABLE = "migration_checkpoints"
+ID_MAP_TABLE = "migration_id_map"
+
+# Bookkeeping tables a migration keeps in the target; never migrated themselves.
+MIGRATION_TABLES = (CHECKPOINT_TABLE, ID_MAP_TABLE)
+
+checkpoint_metadata = MetaData()
+
+# One row per key range of a migrated table. The last range of a table has
+# no range_end, so rows added to the source after a run land in it and are
+# picked up by the next run.
+checkpoints = Table(
+    CHECKPOINT_TABLE,
+    checkpoint_metadata,
+    Column("source_key", String(255), primary_key=True),
+    Column("table_name", String(128), primary_key=True),
+    Column("range_index", Integer, primary_key=True, autoincrement=False),
+    Column("range_start", BigInteger),
+    Column("range_end", BigInteger),
+    Column("last_source_id", BigInteger),
+    Column("updated_at", DateTime),
+)
+
+# The target ID every migrated source row ended up with, including source
+# rows matched to a row the target already had (users by email). Written in
+# the same transaction as the chunk and its checkpoint, so later runs remap
+# foreign keys to rows copied earlier whatever IDs those were given.
+id_mappings = Table(
+    ID_MAP_TABLE,
+    checkpoint_metadata,
+    Column("source_key", String(255), primary_key=True),
+    Column("table_name", String(128), primary_key=True),
+    Column("source_id", BigInteger, primary_key=True, autoincrement=False),
+    Column("target_id", BigInteger, nullable=False),
+)
+
+
+def ensure_checkpoint_table(engine):
+    schema_bootstrap.ensure_tables(engine, checkpoint_metadata)
+
+
+def load_checkpoints(session, source_key, table_name):
+    return session.execute(
+        select(checkpoints)
+        .where(checkpoints.c.source_key == source_key, checkpoints.c.table_name == table_name)
+        .order_by(checkpoints.c.range_index)
+    ).fetchall()
+
+
+def create_checkpoints(session, source_key, table_name, ranges):
+    # The first range starts at the beginning of the table and the last one
+    # stays open, whatever MIN/MAX the split was computed from.
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "source_key": source_key,
+            "table_name": table_name,
+            "range_index": index,
+            "range_start": lower if index else None,
+            "range_end": upper if index < len(ranges) - 1 else None,
+            "last_source_id": None,
+            "updated_at": now,
+        }
+        for index, (lower, upper) in enumerate(ranges)
+    ]
+    session.execute(checkpoints.insert(), rows)
+    session.commit()
+    return load_checkpoints(session, source_key, table_name)
+
+
+def resume_bounds(checkpoint):
+    if checkpoint.last_source_id is not None:
+        return checkpoint.last_source_id + 1, checkpoint.range_end
+    return checkpoint.range_start, checkpoint.range_end
+
+
+def save_checkpoint(session, source_key, table_name, range_index, last_source_id):
+    session.execute(
+        update(checkpoints)
+        .where(
+            checkpoints.c.source_key == source_key,
+            checkpoints.c.table_name == table_name,
+            checkpoints.c.range_index == range_index
+        )
+        .values(last_source_id=last_source_id, updated_at=datetime.now(timezone.utc))
+    )
+
+
+def load_id_mappings(session, source_key, table_name, id_map, chunk_size):
+    query = (
+        select(id_mappings.c.source_id, id_mappings.c.target_id)
+        .where(id_mappings.c.source_key == source_key, id_mappings.c.table_name == table_name)
+        .execution_options(yield_per=chunk_size)
+    )
+    for partition in session.execute(query).partitions():
+        ids = np.asarray(partition, dtype=np.int64).reshape(-1, 2)
+        id_map.add(ids[:, 0], ids[:, 1])
+
+
+def save_id_mappings(session, source_key, table_name, source_ids, target_ids):
+    if len(source_ids):
+        session.execute(
+            id_mappings.insert(),
+            [
+                {"source_key": source_key, "table_name": table_name, "source_id": source_id, "target_id": target_id}
+                for source_id, target_id in zip(source_ids.tolist(), target_ids.tolist())
+            ]
+        )
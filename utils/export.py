@@ -0,0 +1,285 @@
+import datetime
+import os
+import zipfile
+from contextlib import closing
+from xml.sax.saxutils import escape, quoteattr
+import pandas as pd
+from fastapi import HTTPException
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import get_column_letter
+from sqlalchemy import Boolean, Float, Integer, Numeric, DateTime, inspect, select, func
+from utils.models import User, Post, Comment, Product
+from utils.handle_functions import iter_source_chunks
+from utils.metrics import metrics, SOURCE_READ
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "10000"))
+
+# Excel sheets stop at 1,048,576 rows, header included.
+EXCEL_MAX_ROWS = 1_048_575
+
+# In the order /insert_data processes them, so an export loads back as is.
+EXPORT_TABLES = {
+    table.name: table for table in (User.__table__, Product.__table__, Post.__table__, Comment.__table__)
+}
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+ZIP_MEDIA_TYPE = "application/zip"
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+
+class StreamBuffer:
+    """Write-only file object whose contents are handed out with take().
+
+    Encoders write into it and the response yields whatever has piled up,
+    so nothing larger than one chunk of output is ever held in memory.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def iter_export_frames(session_factory, table, chunk_size=EXPORT_CHUNK_SIZE):
+    # Keyset pages keep each query to chunk_size rows, so no cursor or
+    # result set stays open on the server while the client catches up.
+    with closing(session_factory()) as session:
+        yield from metrics.timed_batches(iter_source_chunks(session, table, chunk_size), SOURCE_READ)
+
+
+def csv_bytes(table, frames):
+    header = True
+    for df in frames:
+        yield df.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+    if header:
+        yield pd.DataFrame(columns=[column.name for column in table.columns]).to_csv(index=False).encode("utf-8")
+
+
+def arrow_schema(table):
+    import pyarrow as pa
+
+    fields = []
+    for column in table.columns:
+        if isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, (Float, Numeric)):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, nullable=column.nullable or column.primary_key))
+    return pa.schema(fields)
+
+
+def require_pyarrow():
+    # Checked before the response starts: once the body is streaming the
+    # status is already 200 and an error can only cut the download short.
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise HTTPException(status_code=400, detail="Parquet exports need the 'pyarrow' package to be installed.")
+
+
+def parquet_bytes(table, frames):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Every chunk becomes one row group, written out as soon as it's read.
+    schema = arrow_schema(table)
+    buffer = StreamBuffer()
+    writer = pq.ParquetWriter(buffer, schema)
+    try:
+        for df in frames:
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            yield buffer.take()
+    finally:
+        writer.close()
+    yield buffer.take()
+
+
+def zip_bytes(members):
+    """Stream a zip archive of (name, iterable of bytes) members."""
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, chunks in members:
+            with archive.open(name, "w", force_zip64=True) as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    yield buffer.take()
+            yield buffer.take()
+    yield buffer.take()
+
+
+def xlsx_cell(reference, value):
+    if value is None or value is pd.NA or (isinstance(value, float) and value != value):
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{reference}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    if isinstance(value, (datetime.date, datetime.time)):
+        value = value.isoformat()
+    text = ILLEGAL_CHARACTERS_RE.sub("", str(value))
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def xlsx_row(number, letters, values):
+    cells = "".join(xlsx_cell(f"{letter}{number}", value) for letter, value in zip(letters, values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+def sheet_xml(table, frames):
+    # Strings are written inline rather than to a shared strings table,
+    # which would have to be complete before the first sheet is sent.
+    columns = [column.name for column in table.columns]
+    letters = [get_column_letter(position) for position in range(1, len(columns) + 1)]
+
+    yield (
+        f'{XML_HEADER}<worksheet xmlns="{MAIN_NS}"><sheetData>{xlsx_row(1, letters, columns)}'
+    ).encode("utf-8")
+    number = 2
+    for df in frames:
+        rows = []
+        for values in df.astype(object).itertuples(index=False, name=None):
+            rows.append(xlsx_row(number, letters, values))
+            number += 1
+        yield "".join(rows).encode("utf-8")
+    yield b"</sheetData></worksheet>"
+
+
+def xlsx_bytes(sheets):
+    """Stream a workbook with one sheet per (table, frames) pair, readable by read_file_sync."""
+    overrides = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{number}.xml" '
+        f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for number in range(1, len(sheets) + 1)
+    )
+    content_types = (
+        f'{XML_HEADER}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        f'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        f'<Default Extension="xml" ContentType="application/xml"/>'
+        f'<Override PartName="/xl/workbook.xml" '
+        f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        f'{overrides}</Types>'
+    )
+    package_rels = (
+        f'{XML_HEADER}<Relationships xmlns="{PACKAGE_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>'
+    )
+    sheet_entries = "".join(
+        f'<sheet name={quoteattr(table.name)} sheetId="{number}" r:id="rId{number}"/>'
+        for number, (table, _) in enumerate(sheets, start=1)
+    )
+    workbook = f'{XML_HEADER}<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>{sheet_entries}</sheets></workbook>'
+    workbook_rels = "".join(
+        f'<Relationship Id="rId{number}" Type="{REL_NS}/worksheet" Target="worksheets/sheet{number}.xml"/>'
+        for number in range(1, len(sheets) + 1)
+    )
+    workbook_rels = f'{XML_HEADER}<Relationships xmlns="{PACKAGE_REL_NS}">{workbook_rels}</Relationships>'
+
+    members = [
+        ("[Content_Types].xml", [content_types.encode("utf-8")]),
+        ("_rels/.rels", [package_rels.encode("utf-8")]),
+        ("xl/workbook.xml", [workbook.encode("utf-8")]),
+        ("xl/_rels/workbook.xml.rels", [workbook_rels.encode("utf-8")]),
+    ]
+    members += [
+        (f"xl/worksheets/sheet{number}.xml", sheet_xml(table, frames))
+        for number, (table, frames) in enumerate(sheets, start=1)
+    ]
+    return zip_bytes(members)
+
+
+def export_tables(engine, table_names=None):
+    """Return the model tables to export that exist in the database, in load order."""
+    requested = table_names or list(EXPORT_TABLES)
+    unknown = [name for name in requested if name not in EXPORT_TABLES]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown tables {unknown}; tables that can be exported: {list(EXPORT_TABLES)}"
+        )
+
+    inspector = inspect(engine)
+    tables = [table for name, table in EXPORT_TABLES.items() if name in requested and inspector.has_table(name)]
+    missing = [name for name in requested if name not in {table.name for table in tables}]
+    if table_names and missing:
+        raise HTTPException(status_code=404, detail=f"Tables {missing} not found in the database")
+    if not tables:
+        raise HTTPException(status_code=404, detail="The database has no tables to export")
+    return tables
+
+
+def export_database(db_handler, file_format, table_names=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Return (body chunks, media type, filename) for a streamed export of the database.
+
+    CSV and Parquet hold one table per file, so exporting more than one
+    table gives a zip of <table>.csv / <table>.parquet files. XLSX exports
+    have one sheet per table. Either way the file can be uploaded back
+    through /insert_data.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported export format '{file_format}'; use one of {list(EXPORT_FORMATS)}"
+        )
+
+    if file_format == "parquet":
+        require_pyarrow()
+
+    tables = export_tables(db_handler.engine, table_names)
+
+    def frames(table):
+        return iter_export_frames(db_handler.get_session, table, chunk_size)
+
+    if file_format == "xlsx":
+        with db_handler.engine.connect() as conn:
+            for table in tables:
+                count = conn.execute(select(func.count()).select_from(table)).scalar()
+                if count > EXCEL_MAX_ROWS:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Table '{table.name}' has {count} rows, more than an Excel sheet holds; "
+                               f"export it as csv or parquet"
+                    )
+        body = xlsx_bytes([(table, frames(table)) for table in tables])
+        return body, EXPORT_FORMATS[file_format], f"{db_handler.db_name}.xlsx"
+
+    encode = csv_bytes if file_format == "csv" else parquet_bytes
+    if len(tables) == 1:
+        table = tables[0]
+        return encode(table, frames(table)), EXPORT_FORMATS[file_format], f"{table.name}.{file_format}"
+
+    members = ((f"{table.name}.{file_format}", encode(table, frames(table))) for table in tables)
+    return zip_bytes(members), ZIP_MEDIA_TYPE, f"{db_handler.db_name}.zip"
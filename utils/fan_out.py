@@ -0,0 +1,151 @@
+from functools import partial
+from fastapi import HTTPException
+from utils.bulk_writer import BULK_BATCH_SIZE
+from utils.batch_sizing import BatchSizer, ADAPTIVE_BATCH_MAX
+from utils.jobs import JobCancelled
+from utils.metrics import metrics, SOURCE_READ
+from utils.pipeline import fan_out, PIPELINE_QUEUE_SIZE
+from utils.handle_functions import (
+    MIGRATION_CHUNK_SIZE, MIGRATION_TABLE_WORKERS, iter_source_chunks, table_handler, resume_id_map,
+    plan_ranges, copy_chunks, known_tables, run_in_dependency_order
+)
+
+
+class FanOutTarget:
+    """A target database of a fan-out migration and what is kept for it alone.
+
+    Every target has its own ID maps (offsets and remapping), batch
+    sizers and per-table counts. A target that fails stops receiving rows;
+    the error is kept here and the other targets carry on.
+    """
+
+    def __init__(self, name, session_factory, batch_sizers=None):
+        self.name = name
+        self.session_factory = session_factory
+        self.id_maps = {}
+        self.batch_sizers = batch_sizers
+        self.inserted = {}
+        self.error = None
+
+    def batch_sizer(self, table, chunk_size, batch_size):
+        if self.batch_sizers is None:
+            return None
+        return self.batch_sizers.setdefault(
+            table.name, BatchSizer(batch_size, maximum=min(ADAPTIVE_BATCH_MAX, max(chunk_size, batch_size)))
+        )
+
+    def fail(self, table, error):
+        message = str(error.detail if isinstance(error, HTTPException) else error)
+        print(f"Migration into '{self.name}' failed on {table.name}: {message}")
+        self.error = {"table": table.name, "type": type(error).__name__, "message": message}
+
+
+def read_bounds(works):
+    """Return the (lower, upper) source range covering every target's work ranges."""
+    ranges = [(lower, upper) for work in works for lower, upper, _ in work]
+    lowers = [lower for lower, _ in ranges]
+    uppers = [upper for _, upper in ranges]
+    lower = None if None in lowers else min(lowers)
+    upper = None if None in uppers else max(uppers)
+    return lower, upper
+
+
+def fan_out_table(source_session_factory, table, targets, chunk_size=MIGRATION_CHUNK_SIZE,
+                  batch_size=BULK_BATCH_SIZE, job=None, source_key=None, queue_size=PIPELINE_QUEUE_SIZE):
+    """Read a table from the source once and copy it into every target that hasn't failed.
+
+    Each target gets the rows its own checkpoints still need, transformed
+    with its own ID maps and key lookups, by a writer thread of its own.
+    Returns {target name: rows inserted}.
+    """
+    if len(table.primary_key.columns) != 1:
+        print(f"Skipping {table.name}: migration needs a single-column primary key")
+        return {target.name: 0 for target in targets if target.error is None}
+
+    print(f"Processing {table.name} for {[target.name for target in targets if target.error is None]}...")
+    prepare, skip_message = table_handler(table)
+    source_session = source_session_factory()
+    sessions = []
+    try:
+        live = []
+        for target in targets:
+            if target.error is not None:
+                continue
+            target_session = target.session_factory()
+            sessions.append(target_session)
+            try:
+                resume_id_map(target_session, table, target.id_maps, source_key, chunk_size)
+                transform = prepare(source_session, target_session, table, target.id_maps)
+                # One range per table: the source is read in a single pass
+                # for all targets.
+                work = plan_ranges(source_session, target_session, table, 1, source_key)
+            except JobCancelled:
+                raise
+            except Exception as e:
+                target_session.rollback()
+                target.fail(table, e)
+                continue
+            live.append((target, target_session, transform, work))
+
+        if not live:
+            return {}
+
+        def write_target(target, target_session, transform, work, chunks):
+            # Transforms change the frames they are given, so every target
+            # works on its own copy of the shared chunk.
+            try:
+                return copy_chunks(
+                    target_session, table, transform, (chunk.copy() for chunk in chunks), work, batch_size, job,
+                    target.batch_sizer(table, chunk_size, batch_size), progress_name=f"{target.name}.{table.name}"
+                )
+            except Exception:
+                target_session.rollback()
+                raise
+
+        lower, upper = read_bounds([work for _, _, _, work in live])
+        results = fan_out(
+            metrics.timed_batches(iter_source_chunks(source_session, table, chunk_size, lower, upper), SOURCE_READ, job),
+            [partial(write_target, *item) for item in live],
+            queue_size=queue_size,
+            name=f"fan-out-{table.name}"
+        )
+
+        inserted = {}
+        for (target, _, _, _), (result, error) in zip(live, results):
+            if isinstance(error, JobCancelled):
+                raise error
+            if error is not None:
+                target.fail(table, error)
+                continue
+            count, skipped = result
+            if skipped:
+                print(f"{skip_message} in '{target.name}': {sorted(skipped)}")
+            target.inserted[table.name] = count
+            inserted[target.name] = count
+            print(f"Migrated {count} rows into {target.name}.{table.name}")
+        return inserted
+
+    finally:
+        source_session.close()
+        for target_session in sessions:
+            target_session.close()
+
+
+def fan_out_known_tables(source_session_factory, targets, source_metadata, chunk_size=MIGRATION_CHUNK_SIZE,
+                         batch_size=BULK_BATCH_SIZE, job=None, workers=MIGRATION_TABLE_WORKERS, source_key=None,
+                         queue_size=PIPELINE_QUEUE_SIZE):
+    """Migrate the source into every target, reading each source table once.
+
+    Returns {target name: {table name: rows inserted}}; targets that failed
+    keep the counts of the tables they finished and their error.
+    """
+    def migrate_one(table):
+        inserted = fan_out_table(
+            source_session_factory, table, targets, chunk_size, batch_size, job, source_key, queue_size
+        )
+        if all(target.error is not None for target in targets):
+            raise Exception(f"Migration failed for every target: {[target.error for target in targets]}")
+        return inserted
+
+    run_in_dependency_order(known_tables(source_metadata), migrate_one, workers)
+    return {target.name: target.inserted for target in targets}
@@ -1,241 +1,713 @@
-from sqlalchemy import MetaData, select, func
+import os
+import threading
+from contextlib import closing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from sqlalchemy import Integer, select, func
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import Session
 from fastapi import HTTPException
-
-
-def reflect_metadata(source_handler):
+from database.schema_cache import schema_cache
+from database.engine_registry import engine_registry
+from utils.bulk_writer import BulkWriter, BULK_BATCH_SIZE
+from utils.upsert import frame_records
+from utils.target_keys import TargetKeys, estimate_row_count
+from utils.jobs import JobCancelled
+from utils.pipeline import pipelined
+from utils.batch_sizing import BatchSizer, with_back_off, ADAPTIVE_BATCH_MAX
+from utils.metrics import metrics, SOURCE_READ, TRANSFORM, TARGET_WRITE, COMMIT
+from utils.id_map import IdMap
+from utils.checkpoints import (
+    MIGRATION_TABLES, load_checkpoints, create_checkpoints, resume_bounds, save_checkpoint, load_id_mappings,
+    save_id_mappings
+)
+
+MIGRATION_CHUNK_SIZE = int(os.getenv("MIGRATION_CHUNK_SIZE", "5000"))
+MIGRATION_TABLE_WORKERS = int(os.getenv("MIGRATION_TABLE_WORKERS", "4"))
+MIGRATION_RANGE_WORKERS = int(os.getenv("MIGRATION_RANGE_WORKERS", "1"))
+MIGRATION_PARTITION_MIN_ROWS = int(os.getenv("MIGRATION_PARTITION_MIN_ROWS", "100000"))
+
+# Target connections a key range holds while it's copied: the writer's
+# session and the session the transform does its key lookups on.
+CONNECTIONS_PER_RANGE = 2
+KNOWN_TABLES = ('users', 'posts', 'comments', 'products')
+
+
+def primary_key_column(table):
+    pk_columns = list(table.primary_key.columns)
+    if len(pk_columns) != 1:
+        raise Exception(f"Table {table.name} needs a single-column primary key to be migrated in chunks.")
+    return pk_columns[0]
+
+
+def track_progress(job, table_name, count):
+    if job is None:
+        return
+    job.add_rows(table_name, count)
+    job.check_cancelled()
+
+
+def chunk_frame(rows, table):
+    # Source chunks are handled as DataFrames with one column per table
+    # column. Integer columns use the nullable Int64 dtype so a NULL foreign
+    # key doesn't turn the whole column into floats.
+    frame = pd.DataFrame.from_records(rows, columns=[column.name for column in table.columns])
+    for column in table.columns:
+        if isinstance(column.type, Integer):
+            frame[column.name] = frame[column.name].astype("Int64")
+    return frame
+
+
+def iter_source_chunks(source_session, table, chunk_size=MIGRATION_CHUNK_SIZE, lower=None, upper=None):
+    pk = primary_key_column(table)
+    last_id = None
+
+    while True:
+        query = select(table).order_by(pk).limit(chunk_size)
+        if last_id is not None:
+            query = query.where(pk > last_id)
+        elif lower is not None:
+            query = query.where(pk >= lower)
+        if upper is not None:
+            query = query.where(pk < upper)
+
+        rows = source_session.execute(query).fetchall()
+        if not rows:
+            break
+
+        yield chunk_frame(rows, table)
+
+        if len(rows) < chunk_size:
+            break
+        last_id = rows[-1]._mapping[pk.name]
+
+
+def reflect_metadata(source_handler, tables=None):
     try:
         if not source_handler.engine:
             raise Exception("Source database engine not connected.")
 
-        metadata = MetaData()
-        metadata.reflect(bind=source_handler.engine)
+        metadata = schema_cache.reflect(source_handler.engine, only=tables, exclude=MIGRATION_TABLES)
         print(f"Reflected tables: {list(metadata.tables.keys())}")
         return metadata
 
+    except InvalidRequestError as e:
+        print(f"Error reflecting metadata: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Error reflecting metadata: {str(e)}")
     except Exception as e:
         print(f"Error reflecting metadata: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error reflecting metadata: {str(e)}")
 
 
-def handle_users(source_session, target_session, users_table):
-    try:
-        max_id = target_session.execute(
-            select(func.coalesce(func.max(users_table.c.id), 0))
-        ).scalar()
-
-        existing_emails = {
-            row.email for row in target_session.execute(select(users_table.c.email))
-        }
-        source_data = source_session.execute(select(users_table)).fetchall()
-
-        rows_to_insert = []
-        for row in source_data:
-            row_dict = dict(row._mapping)
-
-            if row_dict['email'] in existing_emails:
-                continue
-
-            new_id = max_id + row_dict['id']
-            row_dict['id'] = new_id
-            rows_to_insert.append(row_dict)
-
-        if rows_to_insert:
-            target_session.execute(users_table.insert().values(rows_to_insert))
-            target_session.commit()
-
-        return len(rows_to_insert)
-
-    except Exception as e:
-        target_session.rollback()
-        raise HTTPException(status_code=500, detail=f"Error migrating users: {str(e)}")
-
-
-def handle_posts(source_session, target_session, posts_table):
-    try:
-        max_id = target_session.execute(
-            select(func.coalesce(func.max(posts_table.c.id), 0))
-        ).scalar()
-
-        users_table = posts_table.metadata.tables['users']
-
-        source_posts = source_session.execute(select(posts_table)).fetchall()
-        if not source_posts:
-            return 0
-
-        target_users_max_id = target_session.execute(
-            select(func.coalesce(func.max(users_table.c.id), 0))
-        ).scalar()
-        source_users_max_id = source_session.execute(
-            select(func.coalesce(func.max(users_table.c.id), 0))
-        ).scalar()
-        id_offset = target_users_max_id - source_users_max_id
-
-        existing_user_ids = {row.id for row in target_session.execute(select(users_table.c.id))}
+def table_id_map(target_session, table, id_maps):
+    if table.name not in id_maps:
+        pk = primary_key_column(table)
+        max_id = target_session.execute(select(func.coalesce(func.max(pk), 0))).scalar()
+        id_maps[table.name] = IdMap(max_id)
+    return id_maps[table.name]
 
-        posts_to_insert = []
-        skipped_posts = []
 
-        for post in source_posts:
-            post_dict = dict(post._mapping)
-            new_author_id = post_dict['author_id'] + id_offset
-
-            if new_author_id not in existing_user_ids:
-                skipped_posts.append(post_dict['id'])
-                continue
-
-            post_dict['id'] = max_id + post_dict['id']
-            post_dict['author_id'] = new_author_id
-            posts_to_insert.append(post_dict)
-
-        if posts_to_insert:
-            target_session.execute(posts_table.insert().values(posts_to_insert))
+def parent_id_map(parent_table, id_maps):
+    id_map = id_maps.get(parent_table.name)
+    if id_map is None:
+        raise Exception(f"Table {parent_table.name} has to be migrated before the tables referencing it.")
+    return id_map
+
+
+def offset_ids(frame, column_name, id_map):
+    # Shift the kept rows' primary keys and record source -> target for them.
+    # Returns the frame and the (source IDs, target IDs) it recorded.
+    source_ids = frame[column_name]
+    frame[column_name] = source_ids + id_map.offset
+    mapping = source_ids.to_numpy(dtype=np.int64), frame[column_name].to_numpy(dtype=np.int64)
+    id_map.add(*mapping)
+    return frame, mapping
+
+
+# Each prepare_* function reads the target state a table's migration
+# depends on (ID offset, key lookups) once, and returns a transform that
+# turns a chunk of source rows (a DataFrame, see chunk_frame) into
+# (rows to insert, skipped source IDs, (source IDs, target IDs) recorded
+# for the chunk or None), working on whole columns at a time.
+# The transform gets the target session of the range it runs in, for key
+# lookups that are done in the database (see TargetKeys).
+# Transforms record the source -> target ID of every row they keep in the
+# table's IdMap, and remap foreign keys through the parent table's map, so
+# a child row only ever points at a row migrated from its source parent.
+# The maps are shared by the key ranges of a table, which may be copied
+# concurrently.
+
+def prepare_users(source_session, target_session, users_table, id_maps):
+    id_map = table_id_map(target_session, users_table, id_maps)
+
+    # Users whose email already exists in the target are not copied again;
+    # references to them are mapped to the existing target user.
+    existing_emails = TargetKeys(target_session, users_table.c.email, users_table.c.id)
+
+    def transform(source_data, target_session):
+        matched = source_data['email'].map(existing_emails.match(target_session, source_data['email']))
+        duplicate = matched.notna()
+        matched_ids = source_data.loc[duplicate, 'id'].to_numpy(dtype=np.int64)
+        matched_targets = matched[duplicate].to_numpy(dtype=np.int64)
+        id_map.add(matched_ids, matched_targets)
+
+        rows_to_insert, (source_ids, target_ids) = offset_ids(source_data[~duplicate].copy(), 'id', id_map)
+        mapping = np.concatenate([matched_ids, source_ids]), np.concatenate([matched_targets, target_ids])
+        return rows_to_insert, [], mapping
+
+    return transform
+
+
+def prepare_posts(source_session, target_session, posts_table, id_maps):
+    id_map = table_id_map(target_session, posts_table, id_maps)
+    users_map = parent_id_map(posts_table.metadata.tables['users'], id_maps)
+
+    def transform(source_posts, target_session):
+        source_posts['author_id'], valid = users_map.remap(source_posts['author_id'])
+        skipped_posts = source_posts.loc[~valid, 'id'].tolist()
+
+        rows_to_insert, mapping = offset_ids(source_posts[valid].copy(), 'id', id_map)
+        return rows_to_insert, skipped_posts, mapping
+
+    return transform
+
+
+def prepare_comments(source_session, target_session, comments_table, id_maps):
+    id_map = table_id_map(target_session, comments_table, id_maps)
+
+    posts_map = parent_id_map(comments_table.metadata.tables['posts'], id_maps)
+    users_map = None
+    if 'author_id' in comments_table.c:
+        users_map = parent_id_map(comments_table.metadata.tables['users'], id_maps)
+
+    def transform(source_comments, target_session):
+        source_comments['post_id'], valid = posts_map.remap(source_comments['post_id'])
+        if users_map is not None:
+            source_comments['author_id'], valid_authors = users_map.remap(source_comments['author_id'])
+            valid = valid & valid_authors
+        skipped_comments = source_comments.loc[~valid, 'id'].tolist()
+
+        rows_to_insert, mapping = offset_ids(source_comments[valid].copy(), 'id', id_map)
+        return rows_to_insert, skipped_comments, mapping
+
+    return transform
+
+
+def prepare_table(source_session, target_session, table, id_maps):
+    pk = primary_key_column(table)
+    integer_ids = isinstance(pk.type, Integer)
+
+    id_map = None
+    earlier_ids = None
+    existing_ids = None
+    if integer_ids:
+        id_map = table_id_map(target_session, table, id_maps)
+        # What earlier runs copied, before this run adds to the map.
+        earlier_ids = id_map.copy()
+    else:
+        existing_ids = TargetKeys(target_session, pk)
+
+    # (column name, IdMap of the parent or None, offset or None, TargetKeys of the parent column or None)
+    # Self-references to rows copied by earlier runs go through their saved
+    # IDs; the others are shifted by this run's offset, since the parent row
+    # may come later in the same chunk or in another key range. Keys to
+    # parents without an ID map (non-integer keys) are copied as they are.
+    fk_rules = []
+    for fk in table.foreign_keys:
+        parent_column = fk.column
+        if parent_column.table is table:
+            if integer_ids:
+                fk_rules.append((fk.parent.name, earlier_ids, id_map.offset, None))
+        elif parent_column.primary_key and parent_column.table.name in id_maps:
+            fk_rules.append((fk.parent.name, id_maps[parent_column.table.name], None, None))
+        else:
+            fk_rules.append((fk.parent.name, None, None, TargetKeys(target_session, parent_column)))
+
+    def transform(source_data, target_session):
+        if not integer_ids:
+            source_data = source_data[~existing_ids.contains(target_session, source_data[pk.name])].copy()
+
+        valid = np.ones(len(source_data), dtype=bool)
+        for column_name, parent_map, offset, valid_values in fk_rules:
+            values = source_data[column_name]
+            if offset is not None:
+                mapped, known = parent_map.remap(values)
+                values = mapped.mask(~known, values + offset)
+            elif parent_map is not None:
+                values, valid_column = parent_map.remap(values)
+                valid &= valid_column
+            elif valid_values is not None:
+                valid &= valid_values.contains(target_session, values) | values.isna().to_numpy()
+            source_data[column_name] = values
+
+        skipped_rows = source_data.loc[~valid, pk.name].tolist()
+        rows_to_insert = source_data[valid].copy()
+        mapping = None
+        if integer_ids:
+            rows_to_insert, mapping = offset_ids(rows_to_insert, pk.name, id_map)
+        return rows_to_insert, skipped_rows, mapping
+
+    return transform
+
+
+# name: (prepare function, skip message, columns it reads, {column: parent table} of the keys it remaps)
+TABLE_HANDLERS = {
+    "users": (prepare_users, "Skipped users", ("email",), {}),
+    "posts": (prepare_posts, "Skipped posts due to missing author IDs", ("author_id",), {"author_id": "users"}),
+    "comments": (
+        prepare_comments, "Skipped comments due to missing post/author", ("post_id",),
+        {"post_id": "posts", "author_id": "users"}
+    ),
+}
+
+
+def handler_fits(table, columns, references):
+    """Return whether a table has the shape its name's prepare_* function was written for.
+
+    That is an integer id primary key, the columns the function reads, and
+    foreign keys exactly where it remaps them: every reference column the
+    table has points at the primary key of the expected parent, and no
+    other column is a foreign key.
+    """
+    pk_columns = list(table.primary_key.columns)
+    if len(pk_columns) != 1 or pk_columns[0].name != "id" or not isinstance(pk_columns[0].type, Integer):
+        return False
+    if any(name not in table.c for name in columns):
+        return False
+
+    for fk in table.foreign_keys:
+        if references.get(fk.parent.name) != fk.column.table.name or not fk.column.primary_key:
+            return False
+    referenced = {fk.parent.name for fk in table.foreign_keys}
+    return all(name in referenced for name in references if name in table.c)
+
+
+def table_handler(table):
+    # Any other table, or a table sharing one of these names but not their
+    # shape, is migrated from its reflected metadata alone.
+    handler = TABLE_HANDLERS.get(table.name.lower())
+    if handler is not None:
+        prepare, skip_message, columns, references = handler
+        if handler_fits(table, columns, references):
+            return prepare, skip_message
+    return prepare_table, f"Skipped {table.name} rows due to missing parent rows"
+
+
+def resume_id_map(target_session, table, id_maps, source_key, chunk_size=MIGRATION_CHUNK_SIZE, seed=True):
+    # New rows of this run are numbered from the target's current highest
+    # ID, whatever was added to it since the last run; the IDs rows got
+    # from earlier runs are read back from the ID map table. Without seed
+    # (INSERT ... SELECT joins that table itself) they aren't loaded.
+    if source_key is None or not isinstance(primary_key_column(table).type, Integer):
+        return
+    id_map = table_id_map(target_session, table, id_maps)
+    if seed:
+        load_id_mappings(target_session, source_key, table.name, id_map, chunk_size)
+    saved = load_checkpoints(target_session, source_key, table.name)
+    if saved:
+        print(f"Resuming {table.name} from checkpoint: {[row.last_source_id for row in saved]}")
+
+
+def max_range_workers():
+    """Return the most key ranges one migration can copy at once.
+
+    Every range holds its connections until it's done, so more of them
+    than an engine's pool has connections wait on the pool and time out.
+    """
+    return max(1, engine_registry.pool_capacity // CONNECTIONS_PER_RANGE)
+
+
+class RangeBudget:
+    """The key ranges the tables of one migration may copy at the same time.
+
+    A running table holds one slot, and when it is split into key ranges
+    it gets as many more as are free, up to what it asked for. Slots come
+    back as tables finish, so a large table running alone can use the
+    whole pool while tables running together share it.
+    """
+
+    def __init__(self, slots=None):
+        self.free = max_range_workers() if slots is None else slots
+        self.condition = threading.Condition()
+
+    def acquire(self, wanted):
+        """Wait for a free slot, take up to wanted of them and return how many were taken."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.free > 0)
+            taken = max(1, min(wanted, self.free))
+            self.free -= taken
+            return taken
+
+    def release(self, slots):
+        if slots:
+            with self.condition:
+                self.free += slots
+                self.condition.notify_all()
+
+
+def split_key_ranges(source_session, table, workers):
+    pk = primary_key_column(table)
+    if workers <= 1 or not isinstance(pk.type, Integer):
+        return [(None, None)]
+    if estimate_row_count(source_session, table) < MIGRATION_PARTITION_MIN_ROWS:
+        return [(None, None)]
+
+    low, high = source_session.execute(select(func.min(pk), func.max(pk))).one()
+    if low is None or high - low < workers:
+        return [(None, None)]
+
+    step = (high - low + 1) // workers
+    bounds = [low + step * i for i in range(workers)] + [high + 1]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def work_mask(source_ids, work):
+    """Return which source IDs fall inside one of the (lower, upper, checkpoint) work ranges."""
+    keep = np.zeros(len(source_ids), dtype=bool)
+    for lower, upper, _ in work:
+        in_range = np.ones(len(source_ids), dtype=bool)
+        if lower is not None:
+            in_range &= (source_ids >= lower).to_numpy(dtype=bool, na_value=False)
+        if upper is not None:
+            in_range &= (source_ids < upper).to_numpy(dtype=bool, na_value=False)
+        keep |= in_range
+    return keep
+
+
+def copy_chunks(target_session, table, transform, source_chunks, work, batch_size=BULK_BATCH_SIZE, job=None,
+                batch_sizer=None, progress_name=None):
+    # Transforming source chunks and writing them to the target run as
+    # pipeline stages, so the source, Python and the target are busy at the
+    # same time. The transform gets its own target session for key lookups,
+    # since the writer's session is in use on this thread. Only rows inside
+    # the work ranges are copied. Each chunk is committed together with the
+    # checkpoints of the ranges it advanced and the target IDs its rows got,
+    # so an interrupted run resumes after the last chunk that made it to the
+    # target, and a chunk that fails in a way smaller batches can fix is
+    # written again with them.
+    pk = primary_key_column(table)
+    lookup_session = Session(bind=target_session.get_bind(), info=dict(target_session.info))
+    source_key = next((checkpoint[0] for _, _, checkpoint in work if checkpoint is not None), None)
+    progress_name = progress_name or table.name
+    inserted = 0
+    skipped = []
+
+    def transform_chunk(source_data):
+        try:
+            with metrics.timer(TRANSFORM, job) as timer:
+                keep = work_mask(source_data[pk.name], work)
+                if not keep.all():
+                    source_data = source_data[keep].copy()
+                timer.rows = len(source_data)
+                source_ids = source_data[pk.name].copy()
+                return source_ids, *transform(source_data, lookup_session)
+        finally:
+            # Lookups only touch temp tables; ending the transaction after
+            # every chunk releases the locks they hold on the target tables.
+            lookup_session.commit()
+
+    def write_chunk(source_ids, records, mapping):
+        writer = BulkWriter(target_session, table, batch_size, commit=False, sizer=batch_sizer)
+        with metrics.timer(TARGET_WRITE, job) as timer:
+            writer.write(records)
+            timer.rows = writer.flush()
+            if source_key is not None and mapping is not None:
+                save_id_mappings(target_session, source_key, table.name, *mapping)
+            for lower, upper, checkpoint in work:
+                if checkpoint is None:
+                    continue
+                in_range = source_ids[work_mask(source_ids, [(lower, upper, checkpoint)])]
+                if len(in_range):
+                    _, range_index = checkpoint
+                    save_checkpoint(target_session, source_key, table.name, range_index, int(in_range.max()))
+        with metrics.timer(COMMIT, job):
             target_session.commit()
+        return writer.inserted
 
-        if skipped_posts:
-            print(f"Skipped posts due to missing author IDs: {sorted(skipped_posts)}")
-
-        return len(posts_to_insert)
-
-    except Exception as e:
-        target_session.rollback()
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error migrating posts: {str(e)}"
-        )
-
-def handle_comments(source_session, target_session, comments_table):
+    chunks = pipelined(source_chunks, transform_chunk, name=f"copy-{table.name}")
     try:
-        max_id = target_session.execute(
-            select(func.coalesce(func.max(comments_table.c.id), 0))
-        ).scalar()
-
-        posts_table = comments_table.metadata.tables['posts']
-        users_table = comments_table.metadata.tables['users']
-
-        source_comments = source_session.execute(select(comments_table)).fetchall()
-        if not source_comments:
-            return 0
-
-        target_users_max_id = target_session.execute(
-            select(func.coalesce(func.max(users_table.c.id), 0))
-        ).scalar()
-        source_users_max_id = source_session.execute(
-            select(func.coalesce(func.max(users_table.c.id), 0))
-        ).scalar()
-        id_offset = target_users_max_id - source_users_max_id
-
-        valid_post_ids = {row.id for row in target_session.execute(select(posts_table.c.id))}
-        valid_user_ids = {row.id for row in target_session.execute(select(users_table.c.id))}
-
-        has_author_id = 'author_id' in comments_table.c
-        comments_to_insert = []
-        skipped_comments = []
-
-        for row in source_comments:
-            c_dict = dict(row._mapping)
-
-            new_post_id = c_dict['post_id'] + id_offset
-            if new_post_id not in valid_post_ids:
-                skipped_comments.append(c_dict['id'])
-                continue
-
-            if has_author_id:
-                new_author_id = c_dict['author_id'] + id_offset
-                if new_author_id not in valid_user_ids:
-                    skipped_comments.append(c_dict['id'])
+        with closing(chunks):
+            for source_ids, rows_to_insert, skipped_ids, mapping in chunks:
+                if source_ids.empty:
                     continue
-                c_dict['author_id'] = new_author_id
-
-            c_dict['id'] = max_id + c_dict['id']
-            c_dict['post_id'] = new_post_id
-            comments_to_insert.append(c_dict)
-
-        if comments_to_insert:
-            target_session.execute(comments_table.insert().values(comments_to_insert))
-            target_session.commit()
-
-        if skipped_comments:
-            print(f"Skipped comments due to missing post/author: {sorted(skipped_comments)}")
-
-        return len(comments_to_insert)
-
-    except Exception as e:
-        target_session.rollback()
-        raise HTTPException(
-            status_code=500,
-            detail=f"Comment migration error: {str(e)}"
-        )
-
-def handle_products(source_session, target_session, products_table):
+                skipped.extend(skipped_ids)
+                records = frame_records(rows_to_insert)
+                count = with_back_off(
+                    batch_sizer, lambda: write_chunk(source_ids, records, mapping), target_session.rollback
+                )
+                inserted += count
+                track_progress(job, progress_name, count)
+    finally:
+        lookup_session.close()
+
+    return inserted, skipped
+
+
+def copy_range(source_session, target_session, table, transform, lower=None, upper=None,
+               chunk_size=MIGRATION_CHUNK_SIZE, batch_size=BULK_BATCH_SIZE, job=None, checkpoint=None,
+               batch_sizer=None):
+    source_chunks = metrics.timed_batches(
+        iter_source_chunks(source_session, table, chunk_size, lower, upper), SOURCE_READ, job
+    )
+    return copy_chunks(
+        target_session, table, transform, source_chunks, [(lower, upper, checkpoint)], batch_size, job, batch_sizer
+    )
+
+
+def copy_range_with_sessions(source_session_factory, target_session_factory, table, transform, lower, upper,
+                             chunk_size=MIGRATION_CHUNK_SIZE, batch_size=BULK_BATCH_SIZE, job=None,
+                             checkpoint=None, batch_sizer=None):
+    source_session = source_session_factory()
+    target_session = target_session_factory()
     try:
-        max_id = target_session.execute(
-            select(products_table.c.id).order_by(products_table.c.id.desc()).limit(1)
-        ).scalar() or 0
-
-        target_product_ids = {row.id for row in target_session.execute(select(products_table.c.id))}
-        source_data = source_session.execute(select(products_table)).fetchall()
-
-        rows_to_insert = []
-        for row in source_data:
-            row_dict = dict(row._mapping)
-            new_id = max_id + row_dict['id']
-            if new_id not in target_product_ids:
-                row_dict['id'] = new_id
-                rows_to_insert.append(row_dict)
-
-        if rows_to_insert:
-            target_session.execute(products_table.insert().values(rows_to_insert))
-            target_session.commit()
-
-        return len(rows_to_insert)
-    except Exception as e:
+        return copy_range(
+            source_session, target_session, table, transform, lower, upper, chunk_size, batch_size, job,
+            checkpoint, batch_sizer
+        )
+    except Exception:
         target_session.rollback()
-        raise HTTPException(status_code=500, detail=f"Error migrating products: {str(e)}")
+        raise
+    finally:
+        source_session.close()
+        target_session.close()
+
+
+def plan_ranges(source_session, target_session, table, range_workers, source_key):
+    """Return (lower, upper, checkpoint) work items for a table.
+
+    Without a source_key, or for tables without an integer key, the table is
+    copied from the start every time. Otherwise the ranges recorded in the
+    checkpoint table are continued from their last committed source ID, and
+    are created from a fresh MIN/MAX split the first time.
+    """
+    pk = primary_key_column(table)
+    if source_key is None or not isinstance(pk.type, Integer):
+        return [
+            (lower, upper, None) for lower, upper in split_key_ranges(source_session, table, range_workers)
+        ]
+
+    saved = load_checkpoints(target_session, source_key, table.name)
+    if not saved:
+        saved = create_checkpoints(
+            target_session, source_key, table.name, split_key_ranges(source_session, table, range_workers)
+        )
 
-def migrate_data(source_session, target_session, table):
+    work = []
+    for checkpoint in saved:
+        lower, upper = resume_bounds(checkpoint)
+        work.append((lower, upper, (source_key, checkpoint.range_index)))
+    return work
+
+
+def migrate_data(source_session_factory, target_session_factory, table, chunk_size=MIGRATION_CHUNK_SIZE,
+                 batch_size=BULK_BATCH_SIZE, job=None, range_workers=MIGRATION_RANGE_WORKERS,
+                 source_key=None, id_maps=None, sql_copy=None, batch_sizer=None, range_budget=None):
+    id_maps = {} if id_maps is None else id_maps
+    # With a range_budget the table waits for a slot before it opens its
+    # sessions, and copies as many ranges at once as it was given.
+    if range_budget is not None:
+        range_workers = range_budget.acquire(1 if sql_copy is not None else range_workers)
+    source_session = source_session_factory()
+    target_session = target_session_factory()
     try:
-        table_name = table.name.lower()
-
-        if table_name == "users":
-            return handle_users(source_session, target_session, table)
-
-        elif table_name == "posts":
-            return handle_posts(source_session, target_session, table)
-
-        elif table_name == "comments":
-            return handle_comments(source_session, target_session, table)
-
-        elif table_name == "products":
-            return handle_products(source_session, target_session, table)
-
+        prepare, skip_message = table_handler(table)
+        resume_id_map(target_session, table, id_maps, source_key, chunk_size, seed=sql_copy is None)
+
+        if sql_copy is not None:
+            return copy_table_in_sql(
+                source_session, target_session, table, sql_copy, job, source_key, id_maps, batch_sizer
+            )
+
+        transform = prepare(source_session, target_session, table, id_maps)
+        work = plan_ranges(source_session, target_session, table, range_workers, source_key)
+        # Slots the table can't use (too few rows to split, or fewer ranges
+        # saved by an earlier run) go back to the other tables.
+        if range_budget is not None and len(work) < range_workers:
+            range_budget.release(range_workers - len(work))
+            range_workers = len(work)
+
+        if len(work) == 1:
+            lower, upper, checkpoint = work[0]
+            inserted, skipped = copy_range(
+                source_session, target_session, table, transform, lower, upper,
+                chunk_size, batch_size, job, checkpoint, batch_sizer
+            )
         else:
-            raise HTTPException(status_code=400, detail=f"Migration not implemented for table: {table_name}")
-
+            # Every range opens sessions of its own; the ones used for
+            # planning go back to the pool before the ranges start.
+            source_session.close()
+            target_session.close()
+            print(f"Copying {table.name} in {len(work)} key ranges: {[item[:2] for item in work]}")
+            max_workers = max(1, min(range_workers, len(work)))
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"range-{table.name}") as executor:
+                futures = [
+                    executor.submit(
+                        copy_range_with_sessions, source_session_factory, target_session_factory, table,
+                        transform, lower, upper, chunk_size, batch_size, job, checkpoint, batch_sizer
+                    )
+                    for lower, upper, checkpoint in work
+                ]
+                results = [future.result() for future in futures]
+
+            inserted = sum(count for count, _ in results)
+            skipped = [source_id for _, skipped_ids in results for source_id in skipped_ids]
+
+        if skipped:
+            print(f"{skip_message}: {sorted(skipped)}")
+
+        return inserted
+
+    except JobCancelled:
+        target_session.rollback()
+        raise
     except Exception as e:
         print(f"Error migrating table {table.name}: {str(e)}")
         target_session.rollback()
         raise HTTPException(status_code=500, detail=f"Error migrating table {table.name}: {str(e)}")
-
-def migrate_known_tables(source_session, target_session, source_metadata):
-    inserted_counts = {}
-    processing_order = ['users', 'posts', 'comments', 'products']
-
-    for table_name in processing_order:
-        table = source_metadata.tables.get(table_name)
-        if table is None:
-            print(f"Table {table_name} not found in source database")
-            continue
-
-        print(f"Processing {table_name}...")
-
-        if table_name == 'posts':
-            inserted = migrate_data(source_session, target_session, table)
-            target_session.commit()
-            print(f"Committed {inserted} posts before processing comments")
+    finally:
+        source_session.close()
+        target_session.close()
+        if range_budget is not None:
+            range_budget.release(range_workers)
+
+
+def copy_table_in_sql(source_session, target_session, table, sql_copy, job=None, source_key=None, id_maps=None,
+                      batch_sizer=None):
+    # Same-instance path: INSERT ... SELECT run by the server, one statement
+    # per key range, or per slice of batch_sizer keys when one is given.
+    # Ranges are still planned so checkpoints work the same way.
+    if isinstance(primary_key_column(table).type, Integer):
+        table_id_map(target_session, table, id_maps)
+
+    inserted = 0
+    for lower, upper, checkpoint in plan_ranges(source_session, target_session, table, 1, source_key):
+        with metrics.timer(TARGET_WRITE, job) as timer:
+            count = sql_copy.copy_range(
+                target_session, table, id_maps, source_key, lower, upper, checkpoint, batch_sizer
+            )
+            timer.rows = count
+        inserted += count
+        track_progress(job, table.name, count)
+    return inserted
+
+
+def table_dependencies(tables):
+    names = {table.name for table in tables}
+    return {
+        table.name: {
+            fk.column.table.name
+            for fk in table.foreign_keys
+            if fk.column.table.name in names and fk.column.table is not table
+        }
+        for table in tables
+    }
+
+
+def migrate_table(source_session_factory, target_session_factory, table, chunk_size=MIGRATION_CHUNK_SIZE,
+                  batch_size=BULK_BATCH_SIZE, job=None, range_workers=MIGRATION_RANGE_WORKERS,
+                  source_key=None, id_maps=None, sql_copy=None, batch_sizers=None, range_budget=None):
+    if len(table.primary_key.columns) != 1:
+        print(f"Skipping {table.name}: migration needs a single-column primary key")
+        return 0
+
+    # With batch_sizers (a dict filled per table name) the write size is
+    # tuned during the run: rows per insert batch, or source keys per
+    # INSERT ... SELECT on the same-instance path.
+    batch_sizer = None
+    if batch_sizers is not None:
+        if sql_copy is not None:
+            batch_sizer = batch_sizers.setdefault(table.name, BatchSizer(chunk_size))
         else:
-            inserted = migrate_data(source_session, target_session, table)
+            # An insert batch never spans more than one source chunk.
+            batch_sizer = batch_sizers.setdefault(
+                table.name, BatchSizer(batch_size, maximum=min(ADAPTIVE_BATCH_MAX, max(chunk_size, batch_size)))
+            )
+
+    print(f"Processing {table.name}...")
+    inserted = migrate_data(
+        source_session_factory, target_session_factory, table, chunk_size, batch_size, job, range_workers,
+        source_key, id_maps, sql_copy, batch_sizer, range_budget
+    )
+    print(f"Migrated {inserted} rows into {table.name}")
+    return inserted
+
+
+def known_tables(source_metadata):
+    tables = {
+        table.name: table for table in source_metadata.sorted_tables if table.name not in MIGRATION_TABLES
+    }
+    for table_name in KNOWN_TABLES:
+        if table_name not in tables:
+            print(f"Table {table_name} not found in source database")
+    return tables
+
+
+def run_in_dependency_order(tables, migrate_one, workers=MIGRATION_TABLE_WORKERS):
+    """Call migrate_one(table) for every table and return {table name: result}.
+
+    A table starts as soon as every table it references has finished, so
+    independent tables (e.g. products next to users -> posts -> comments)
+    run at the same time, each on its own source and target connection.
+    """
+    pending = table_dependencies(tables.values())
+    running = {}
+    results = {}
+    errors = []
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="migrate") as executor:
+        while pending or running:
+            ready = [] if errors else sorted(
+                name for name, parents in pending.items() if parents <= results.keys()
+            )
+            for table_name in ready:
+                del pending[table_name]
+                running[executor.submit(migrate_one, tables[table_name])] = table_name
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                table_name = running.pop(future)
+                try:
+                    results[table_name] = future.result()
+                except Exception as e:
+                    errors.append(e)
+
+    if errors:
+        raise errors[0]
+    if pending:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Foreign key cycle between tables: {sorted(pending)}"
+        )
 
-        inserted_counts[table_name] = inserted
-        print(f"Migrated {inserted} rows into {table_name}")
+    return results
+
+
+def migrate_known_tables(source_session_factory, target_session_factory, source_metadata,
+                         chunk_size=MIGRATION_CHUNK_SIZE, batch_size=BULK_BATCH_SIZE, job=None,
+                         workers=MIGRATION_TABLE_WORKERS, range_workers=MIGRATION_RANGE_WORKERS,
+                         source_key=None, sql_copy=None, batch_sizers=None):
+    id_maps = {}
+    # INSERT ... SELECT remaps keys through the ID map table, which is kept
+    # per source; without a source_key the rows go through Python.
+    if source_key is None:
+        sql_copy = None
+    # The key ranges of every table running at the same time share one
+    # budget, sized to the pool.
+    range_budget = RangeBudget()
+    limit = max_range_workers()
+    if range_workers > limit:
+        print(f"Using {limit} range workers instead of {range_workers}: more would need more connections "
+              f"than the pool has ({engine_registry.pool_capacity})")
+        range_workers = limit
+
+    def migrate_one(table):
+        return migrate_table(
+            source_session_factory, target_session_factory, table, chunk_size, batch_size, job, range_workers,
+            source_key, id_maps, sql_copy, batch_sizers, range_budget
+        )
 
-    return inserted_counts
+    return run_in_dependency_order(known_tables(source_metadata), migrate_one, workers)
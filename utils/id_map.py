@@ -0,0 +1,77 @@
+import threading
+import numpy as np
+import pandas as pd
+
+
+class IdMap:
+    """Source -> target primary keys of one migrated table.
+
+    The IDs are kept in two sorted int64 arrays (16 bytes per row) instead of
+    a dict of Python ints, and foreign keys are looked up a whole chunk at a
+    time. offset is what the table's transform adds to new source IDs: the
+    target's highest ID when the run started, so new rows land above every
+    row the target has by then. IDs given out by earlier runs are loaded
+    from the migration_id_map table instead of being derived from it.
+    """
+
+    def __init__(self, offset=0):
+        self.offset = offset
+        self.source_ids = np.empty(0, dtype=np.int64)
+        self.target_ids = np.empty(0, dtype=np.int64)
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.source_ids) + sum(len(source_ids) for source_ids, _ in self.pending)
+
+    def add(self, source_ids, target_ids):
+        source_ids = np.asarray(source_ids, dtype=np.int64)
+        target_ids = np.asarray(target_ids, dtype=np.int64)
+        if source_ids.shape != target_ids.shape:
+            raise ValueError("Source and target ID arrays must have the same length.")
+        if len(source_ids):
+            with self.lock:
+                self.pending.append((source_ids, target_ids))
+
+    def copy(self):
+        """Return a map with the same IDs and offset that later adds to this one don't reach."""
+        source_ids, target_ids = self._arrays()
+        copied = IdMap(self.offset)
+        copied.source_ids, copied.target_ids = source_ids, target_ids
+        return copied
+
+    def _arrays(self):
+        # Chunks added by the range workers are merged in once, on the first
+        # lookup after they were added, rather than on every add.
+        with self.lock:
+            if self.pending:
+                source_ids = np.concatenate([self.source_ids] + [ids for ids, _ in self.pending])
+                target_ids = np.concatenate([self.target_ids] + [ids for _, ids in self.pending])
+                order = np.argsort(source_ids, kind="stable")
+                self.source_ids = source_ids[order]
+                self.target_ids = target_ids[order]
+                self.pending = []
+            return self.source_ids, self.target_ids
+
+    def lookup(self, source_ids):
+        """Return (target IDs, found mask) for an array of source IDs."""
+        values = np.asarray(source_ids, dtype=np.int64)
+        known_source, known_target = self._arrays()
+        if not len(known_source):
+            return np.zeros(len(values), dtype=np.int64), np.zeros(len(values), dtype=bool)
+
+        positions = np.minimum(np.searchsorted(known_source, values), len(known_source) - 1)
+        found = known_source[positions] == values
+        return np.where(found, known_target[positions], 0), found
+
+    def remap(self, values):
+        """Map a Series of foreign-key values, which may contain nulls.
+
+        Returns the mapped values as an Int64 Series (nulls stay null) and a
+        mask that is False where a value has no mapping.
+        """
+        present = values.notna().to_numpy()
+        targets, found = self.lookup(values.fillna(0).to_numpy(dtype=np.int64))
+        mapped = pd.Series(targets, index=values.index, dtype="Int64").mask(~present)
+        return mapped, found | ~present
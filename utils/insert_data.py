@@ -1,95 +1,129 @@
+import time
+import pandas as pd
 from utils.models import User, Post, Comment, Product
+from utils.schemas import UserCreate, PostCreate, CommentCreate, ProductCreate
 from fastapi import HTTPException
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from database.source_db import Base
-
-
-def insert_data_in_table(sheets_dict, db_handler):
+from database.schema_bootstrap import schema_bootstrap
+from utils.bulk_writer import BULK_BATCH_SIZE
+from utils.upsert import upsert_frame
+from utils.jobs import JobCancelled
+from utils.metrics import metrics, PARSE, VALIDATE, TARGET_WRITE, COMMIT
+from utils.validation import validate_frame, RejectReport, FIRST_DATA_ROW
+from utils.batch_sizing import BatchSizer, with_back_off
+
+UPSERT_RULES = {
+    "users": {"table": User.__table__, "schema": UserCreate, "key": ["email"], "update": True},
+    "products": {"table": Product.__table__, "schema": ProductCreate, "key": ["name"], "update": True},
+    "posts": {
+        "table": Post.__table__, "schema": PostCreate, "key": ["title"], "update": True,
+        "foreign_key": ("author_id", User.__table__)
+    },
+    "comments": {
+        "table": Comment.__table__, "schema": CommentCreate, "key": ["post_id", "text"], "update": False,
+        "foreign_key": ("post_id", Post.__table__)
+    },
+}
+
+
+def insert_data_in_table(sheets_dict, db_handler, batch_size=BULK_BATCH_SIZE, job=None, session_factory=None,
+                         batch_sizers=None):
     if not isinstance(sheets_dict, dict):
         raise HTTPException(
             status_code=400,
-            detail="Input data must be a dictionary of DataFrames"
+            detail="Input data must be a dictionary of DataFrames or DataFrame batches"
         )
 
     results = {
-        "users": {"inserted": 0, "updated": 0, "skipped": 0},
-        "products": {"inserted": 0, "updated": 0, "skipped": 0},
-        "posts": {"inserted": 0, "updated": 0, "skipped": 0},
-        "comments": {"inserted": 0, "skipped": 0, "invalid_post_ids": []}
+        "users": {"inserted": 0, "updated": 0, "skipped": 0, "rejected": 0},
+        "products": {"inserted": 0, "updated": 0, "skipped": 0, "rejected": 0},
+        "posts": {"inserted": 0, "updated": 0, "skipped": 0, "rejected": 0},
+        "comments": {"inserted": 0, "skipped": 0, "rejected": 0, "invalid_post_ids": []},
+        "rejects": {}
     }
 
-    session = db_handler.get_session()
+    session = (session_factory or db_handler.get_session)()
     try:
-        Base.metadata.create_all(bind=db_handler.engine)
+        schema_bootstrap.ensure_tables(db_handler.engine, Base.metadata)
         processing_order = ['users', 'products', 'posts', 'comments']
 
         for table_name in processing_order:
             if table_name not in sheets_dict:
                 continue
 
-            df = sheets_dict[table_name]
-            data = df.to_dict('records')
-
-            if table_name == 'users':
-                for record in data:
-                    existing = session.query(User).filter_by(email=record['email']).first()
-                    if existing:
-                        for key, value in record.items():
-                            setattr(existing, key, value)
-                        results['users']['updated'] += 1
-                    else:
-                        session.add(User(**record))
-                        results['users']['inserted'] += 1
-
-            elif table_name == 'products':
-                for record in data:
-                    existing = session.query(Product).filter_by(name=record['name']).first()
-                    if existing:
-                        for key, value in record.items():
-                            setattr(existing, key, value)
-                        results['products']['updated'] += 1
-                    else:
-                        session.add(Product(**record))
-                        results['products']['inserted'] += 1
-
-            elif table_name == 'posts':
-                valid_user_ids = {u.id for u in session.query(User.id).all()}
-                for record in data:
-                    if record['author_id'] not in valid_user_ids:
-                        results['posts']['skipped'] += 1
-                        continue
-
-                    existing = session.query(Post).filter_by(title=record['title']).first()
-                    if existing:
-                        for key, value in record.items():
-                            setattr(existing, key, value)
-                        results['posts']['updated'] += 1
-                    else:
-                        session.add(Post(**record))
-                        results['posts']['inserted'] += 1
-
-            elif table_name == 'comments':
-                valid_post_ids = {p.id for p in session.query(Post.id).all()}
-                for record in data:
-                    post_id = record.get('post_id')
-                    if post_id not in valid_post_ids:
-                        results['comments']['invalid_post_ids'].append(post_id)
-                        results['comments']['skipped'] += 1
-                        continue
-
-                    existing = session.query(Comment).filter_by(
-                        post_id=record['post_id'],
-                        text=record['text']
-                    ).first()
-
-                    if not existing:
-                        session.add(Comment(**record))
-                        results['comments']['inserted'] += 1
-                    else:
-                        results['comments']['skipped'] += 1
-
-            session.commit()
-
+            sheet = sheets_dict[table_name]
+            batches = [sheet] if isinstance(sheet, pd.DataFrame) else sheet
+            rules = UPSERT_RULES[table_name]
+            table_results = results[table_name]
+            report = RejectReport()
+            sizer = None
+            if batch_sizers is not None:
+                sizer = batch_sizers.setdefault(table_name, BatchSizer(batch_size))
+            written = 0
+            sheet_rows = 0
+
+            for df in metrics.timed_batches(batches, PARSE, job):
+                if job is not None:
+                    job.check_cancelled()
+
+                # Bad rows are split off here and reported instead of failing
+                # the whole batch inside the database.
+                with metrics.timer(VALIDATE, job) as timer:
+                    rejected = report.rejected
+                    batch_rows = len(df)
+                    df = validate_frame(
+                        df, rules["schema"], rules["table"], rules["key"], report, FIRST_DATA_ROW + sheet_rows,
+                        update_existing=rules["update"]
+                    )
+                    sheet_rows += batch_rows
+                    timer.rows = batch_rows
+                table_results['rejected'] += report.rejected - rejected
+
+                # With a sizer the batch is upserted and committed in parts
+                # of sizer.size rows; otherwise in one go.
+                position = 0
+                while position < len(df):
+                    def upsert_part(position=position):
+                        part = df.iloc[position:position + (sizer.size if sizer is not None else len(df))]
+                        started = time.perf_counter()
+                        with metrics.timer(TARGET_WRITE, job) as timer:
+                            counts = upsert_frame(
+                                session,
+                                rules["table"],
+                                part,
+                                rules["key"],
+                                update_existing=rules["update"],
+                                foreign_key=rules.get("foreign_key"),
+                                batch_size=batch_size
+                            )
+                            timer.rows = counts['inserted'] + counts['updated']
+                        with metrics.timer(COMMIT, job):
+                            session.commit()
+                        if sizer is not None:
+                            sizer.observe(len(part), time.perf_counter() - started)
+                        return counts, len(part)
+
+                    counts, part_rows = with_back_off(sizer, upsert_part, session.rollback)
+                    position += part_rows
+
+                    table_results['inserted'] += counts['inserted']
+                    table_results['skipped'] += counts['skipped']
+                    if 'updated' in table_results:
+                        table_results['updated'] += counts['updated']
+                    if 'invalid_post_ids' in table_results:
+                        table_results['invalid_post_ids'].extend(counts['invalid_keys'])
+
+                    written += counts['inserted'] + counts['updated']
+                    if job is not None:
+                        job.set_rows(table_name, written)
+
+            if report.rejected:
+                results['rejects'][table_name] = report.to_dict()
+
+    except JobCancelled:
+        session.rollback()
+        raise
     except IntegrityError as e:
         session.rollback()
         raise HTTPException(
@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils.metrics import stage_summary
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "50"))
+JOBS_PER_DATABASE = int(os.getenv("JOBS_PER_DATABASE", "1"))
+JOB_HISTORY_LIMIT = int(os.getenv("JOB_HISTORY_LIMIT", "500"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind, target_db, func, args, cleanup=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.target_db = target_db
+        # A job writing to several databases (a fan-out migration) holds a
+        # slot on each of them while it runs.
+        self.databases = [target_db] if isinstance(target_db, str) else list(target_db)
+        self.func = func
+        self.args = args
+        self.cleanup = cleanup
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.rows = {}
+        self.stages = {}
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def set_rows(self, table_name, count):
+        with self.lock:
+            self.rows[table_name] = count
+
+    def add_rows(self, table_name, count):
+        with self.lock:
+            self.rows[table_name] = self.rows.get(table_name, 0) + count
+
+    def observe(self, stage, seconds, rows=0, size=0):
+        with self.lock:
+            totals = self.stages.setdefault(stage, [0, 0.0, 0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += rows
+            totals[3] += size
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def to_dict(self):
+        with self.lock:
+            rows = dict(self.rows)
+            stages = {stage: stage_summary(*totals) for stage, totals in self.stages.items()}
+
+        elapsed = None
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+
+        total_rows = sum(rows.values())
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "target_db": self.target_db,
+            "state": self.state,
+            "cancel_requested": self.cancel_event.is_set(),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": elapsed,
+            "rows": rows,
+            "total_rows": total_rows,
+            "rows_per_second": total_rows / elapsed if elapsed else 0.0,
+            "result": self.result,
+            "metrics": stages,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    def __init__(self, workers=JOB_WORKERS, queue_limit=JOB_QUEUE_LIMIT,
+                 per_database=JOBS_PER_DATABASE, history_limit=JOB_HISTORY_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.per_database = per_database
+        self.history_limit = history_limit
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self.jobs = OrderedDict()
+        self.queue = deque()
+        self.running = {}
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def submit(self, kind, target_db, func, *args, cleanup=None):
+        # cleanup runs only for jobs cancelled before they start; a running
+        # job is expected to release its own resources.
+        job = Job(kind, target_db, func, args, cleanup)
+        with self.lock:
+            if len(self.queue) >= self.queue_limit:
+                raise JobQueueFull(f"Job queue is full ({self.queue_limit} jobs waiting)")
+
+            self.jobs[job.id] = job
+            self.queue.append(job)
+            self._prune_history()
+            self._dispatch()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def state_counts(self):
+        with self.lock:
+            counts = dict.fromkeys((QUEUED, RUNNING) + FINISHED_STATES, 0)
+            for job in self.jobs.values():
+                counts[job.state] += 1
+            return counts
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.state in FINISHED_STATES:
+                return job
+
+            job.cancel_event.set()
+            if job.state != QUEUED:
+                return job
+
+            self.queue.remove(job)
+            job.state = CANCELLED
+            job.finished_at = time.time()
+
+        if job.cleanup is not None:
+            job.cleanup()
+        return job
+
+    def _dispatch(self):
+        # FIFO, except that a job whose target databases aren't all below
+        # their concurrency limit is passed over until one of those jobs
+        # finishes. A job passed over keeps its databases reserved, so later
+        # jobs on any of them can't keep a multi-database job waiting.
+        reserved = set()
+        for job in list(self.queue):
+            if self.active >= self.workers:
+                break
+            if reserved.intersection(job.databases) or any(
+                self.running.get(database, 0) >= self.per_database for database in job.databases
+            ):
+                reserved.update(job.databases)
+                continue
+
+            self.queue.remove(job)
+            self.active += 1
+            for database in job.databases:
+                self.running[database] = self.running.get(database, 0) + 1
+            job.state = RUNNING
+            job.started_at = time.time()
+            self.executor.submit(self._run, job)
+
+    def _run(self, job):
+        try:
+            job.result = job.func(*job.args, job=job)
+            job.state = COMPLETED
+        except JobCancelled:
+            job.state = CANCELLED
+        except Exception as e:
+            job.error = {
+                "type": type(e).__name__,
+                "message": str(getattr(e, "detail", e)),
+                "traceback": traceback.format_exc(),
+            }
+            job.state = FAILED
+        finally:
+            job.finished_at = time.time()
+            with self.lock:
+                self.active -= 1
+                for database in job.databases:
+                    self.running[database] -= 1
+                    if not self.running[database]:
+                        del self.running[database]
+                self._dispatch()
+
+    def _prune_history(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.state in FINISHED_STATES]
+        for job_id in finished[:max(0, len(self.jobs) - self.history_limit)]:
+            del self.jobs[job_id]
+
+
+job_manager = JobManager()
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from sqlalchemy import event
+
+METRIC_PREFIX = "dbapp"
+
+# Stage names used across uploads and migrations.
+UPLOAD_RECEIVE = "upload_receive"
+PARSE = "parse"
+VALIDATE = "validate"
+REFLECTION = "reflection"
+SOURCE_READ = "source_read"
+TRANSFORM = "transform"
+TARGET_WRITE = "target_write"
+COMMIT = "commit"
+
+
+class StageTimer:
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+
+
+def stage_summary(calls, seconds, rows, size):
+    return {
+        "calls": calls,
+        "seconds": seconds,
+        "rows": rows,
+        "bytes": size,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+    }
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(index=False).sum())
+
+
+class Metrics:
+    """Process-wide stage timings and SQL statement counters.
+
+    observe() adds to the totals exported on /metrics and, when a job is
+    given, to that job's own per-stage numbers.
+    """
+
+    def __init__(self):
+        self.stages = defaultdict(lambda: [0, 0.0, 0, 0])
+        self.statements = defaultdict(lambda: [0, 0.0])
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds, rows=0, size=0, job=None):
+        with self.lock:
+            totals = self.stages[stage]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += rows
+            totals[3] += size
+        if job is not None:
+            job.observe(stage, seconds, rows, size)
+
+    @contextmanager
+    def timer(self, stage, job=None):
+        """Time a block; set .rows / .bytes on the yielded object to record them too."""
+        timer = StageTimer()
+        start = time.perf_counter()
+        try:
+            yield timer
+        finally:
+            self.observe(stage, time.perf_counter() - start, timer.rows, timer.bytes, job)
+
+    def timed_batches(self, batches, stage, job=None):
+        """Yield DataFrames from batches, timing how long each one took to produce."""
+        iterator = iter(batches)
+        while True:
+            start = time.perf_counter()
+            try:
+                df = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.perf_counter() - start, len(df), frame_bytes(df), job)
+            yield df
+
+    def observe_statement(self, database, statement, seconds):
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        with self.lock:
+            totals = self.statements[(database or "", verb)]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def render(self, job_counts=None):
+        """Return everything in the Prometheus text exposition format."""
+        with self.lock:
+            stages = {stage: list(totals) for stage, totals in self.stages.items()}
+            statements = {key: list(totals) for key, totals in self.statements.items()}
+
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+                lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}")
+
+        ordered = sorted(stages.items())
+        family("stage_calls_total", "counter", "Times each pipeline stage ran.",
+               [({"stage": stage}, totals[0]) for stage, totals in ordered])
+        family("stage_seconds_total", "counter", "Seconds spent in each pipeline stage.",
+               [({"stage": stage}, round(totals[1], 6)) for stage, totals in ordered])
+        family("stage_rows_total", "counter", "Rows handled by each pipeline stage.",
+               [({"stage": stage}, totals[2]) for stage, totals in ordered])
+        family("stage_bytes_total", "counter", "Bytes handled by each pipeline stage.",
+               [({"stage": stage}, totals[3]) for stage, totals in ordered])
+
+        ordered = sorted(statements.items())
+        family("db_statements_total", "counter", "SQL statements executed, by database and statement type.",
+               [({"database": db, "statement": verb}, totals[0]) for (db, verb), totals in ordered])
+        family("db_statement_seconds_total", "counter", "Seconds spent executing SQL statements.",
+               [({"database": db, "statement": verb}, round(totals[1], 6)) for (db, verb), totals in ordered])
+
+        if job_counts is not None:
+            family("jobs", "gauge", "Jobs currently known to the job manager, by state.",
+                   [({"state": state}, count) for state, count in sorted(job_counts.items())])
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def instrument_engine(engine):
+    database = engine.url.database
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start_time"].pop()
+        metrics.observe_statement(database, statement, time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # A failed statement never reaches after_cursor_execute.
+        connection = context.connection
+        if connection is not None and connection.info.get("query_start_time"):
+            connection.info["query_start_time"].pop()
+
+
+metrics = Metrics()
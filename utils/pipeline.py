@@ -0,0 +1,158 @@
+import os
+import queue
+import threading
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+
+_DONE = object()
+
+
+def pipelined(items, *stages, queue_size=PIPELINE_QUEUE_SIZE, name="pipeline"):
+    """Yield stages[-1](... stages[0](item)) for every item, in order.
+
+    Iterating items and each stage run in their own thread, connected by
+    queues of queue_size entries, so reading, transforming and whatever the
+    caller does with the results overlap. A full queue blocks the stage
+    feeding it, which keeps memory bounded when the consumer is the slow
+    side. The first error raised by any stage is re-raised to the caller,
+    and closing the generator stops every thread.
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+
+    def put(target, item):
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(source):
+        while not stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def fail(error):
+        errors.append(error)
+        stop.set()
+
+    def read():
+        try:
+            for item in items:
+                if not put(queues[0], item):
+                    break
+        except BaseException as e:
+            fail(e)
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+            put(queues[0], _DONE)
+
+    def work(stage, source, target):
+        try:
+            while (item := get(source)) is not _DONE:
+                if not put(target, stage(item)):
+                    break
+        except BaseException as e:
+            fail(e)
+        finally:
+            put(target, _DONE)
+
+    threads = [threading.Thread(target=read, name=f"{name}-read", daemon=True)]
+    for position, stage in enumerate(stages):
+        threads.append(threading.Thread(
+            target=work, args=(stage, queues[position], queues[position + 1]),
+            name=f"{name}-stage{position + 1}", daemon=True
+        ))
+    for thread in threads:
+        thread.start()
+
+    try:
+        while (item := get(queues[-1])) is not _DONE:
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def fan_out(items, consumers, queue_size=PIPELINE_QUEUE_SIZE, name="fan-out"):
+    """Feed every item to each consumer and return [(result, error)] in consumer order.
+
+    Each consumer is called once, in its own thread, with an iterable of
+    the items, fed through its own queue of queue_size entries. A full
+    queue blocks the feeder, so a slow consumer holds the others back by
+    at most queue_size items. A consumer that raises or returns early
+    stops being fed and the others carry on; its error is returned rather
+    than raised. An error iterating items ends every consumer's iterable
+    with that error, and is raised once they have all stopped.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in consumers]
+    finished = [threading.Event() for _ in consumers]
+    results = [(None, None)] * len(consumers)
+    feed_errors = []
+
+    def received(position):
+        while True:
+            try:
+                item = queues[position].get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                if feed_errors:
+                    raise feed_errors[0]
+                return
+            yield item
+
+    def consume(position, consumer):
+        try:
+            results[position] = (consumer(received(position)), None)
+        except BaseException as e:
+            results[position] = (None, e)
+        finally:
+            finished[position].set()
+
+    def put(position, item):
+        while not finished[position].is_set():
+            try:
+                queues[position].put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    threads = [
+        threading.Thread(target=consume, args=(position, consumer), name=f"{name}-{position + 1}", daemon=True)
+        for position, consumer in enumerate(consumers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for item in items:
+            if all(event.is_set() for event in finished):
+                break
+            for position in range(len(consumers)):
+                put(position, item)
+    except BaseException as e:
+        feed_errors.append(e)
+    finally:
+        close = getattr(items, "close", None)
+        if close is not None:
+            close()
+        for position in range(len(consumers)):
+            put(position, _DONE)
+        for thread in threads:
+            thread.join()
+
+    if feed_errors:
+        raise feed_errors[0]
+    return results
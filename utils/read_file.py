@@ -1,33 +1,190 @@
+import os
+import zipfile
 import pandas as pd
-from io import BytesIO
+from contextlib import contextmanager, ExitStack
+from openpyxl import load_workbook
 
-def read_file_sync(file_content: bytes, filename: str):
-    print(f"Starting to read file: {filename}")
+SHEET_BATCH_SIZE = int(os.getenv("SHEET_BATCH_SIZE", "10000"))
 
-    try:
-        if not file_content:
-            print("File content is empty.")
-            raise ValueError("Uploaded file is empty.")
+CONTENT_TYPE_FORMATS = {
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    "application/vnd.ms-excel": "xls",
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/gzip": "csv.gz",
+    "application/x-gzip": "csv.gz",
+    "application/zip": "zip",
+    "application/x-zip-compressed": "zip",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+}
+
+
+def detect_format(filename: str, content_type: str = None):
+    name = filename.lower()
+    for extension in ("csv.gz", "xlsx", "xls", "csv", "zip", "parquet"):
+        if name.endswith(f".{extension}"):
+            return extension
+    if name.endswith(".gz"):
+        return "csv.gz"
+
+    if content_type:
+        file_format = CONTENT_TYPE_FORMATS.get(content_type.split(";")[0].strip().lower())
+        if file_format:
+            return file_format
+
+    raise ValueError(f"Unsupported file type: {filename}")
+
+
+def table_name_from(filename: str):
+    name = os.path.basename(filename).lower()
+    for extension in (".csv.gz", ".gz", ".csv", ".parquet"):
+        if name.endswith(extension):
+            return name[:-len(extension)]
+    return name
+
+
+def iter_sheet_batches(worksheet, batch_size=SHEET_BATCH_SIZE):
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    keep = [position for position, name in enumerate(header) if name is not None]
+    columns = [str(header[position]).strip() for position in keep]
 
-        print("Loading Excel file into pandas...")
-        xls = pd.ExcelFile(BytesIO(file_content))
-        print(f"Excel file loaded successfully. Sheet names: {xls.sheet_names}")
+    batch = []
+    for row in rows:
+        values = [row[position] if position < len(row) else None for position in keep]
+        if all(value is None for value in values):
+            continue
 
-        all_sheets_df = {}
-        for sheet_name in xls.sheet_names:
-            print(f"Parsing sheet: {sheet_name}")
-            df = xls.parse(sheet_name)
-            print(f"Sheet '{sheet_name}' parsed. Shape: {df.shape}")
+        batch.append(values)
+        if len(batch) >= batch_size:
+            yield pd.DataFrame(batch, columns=columns)
+            batch = []
 
-            if not isinstance(df, pd.DataFrame):
-                print(f"Sheet '{sheet_name}' is not a valid DataFrame.")
-                raise ValueError(f"Sheet '{sheet_name}' could not be parsed as DataFrame")
+    if batch:
+        yield pd.DataFrame(batch, columns=columns)
 
-            all_sheets_df[sheet_name.lower()] = df
 
-        print("All sheets parsed and stored successfully.")
-        return all_sheets_df
+def iter_csv_batches(source, batch_size=SHEET_BATCH_SIZE, compression="infer"):
+    with pd.read_csv(source, chunksize=batch_size, compression=compression) as reader:
+        for df in reader:
+            df.columns = [str(column).strip() for column in df.columns]
+            yield df
 
+
+def iter_zip_member_batches(archive, member, batch_size=SHEET_BATCH_SIZE, compression=None):
+    with archive.open(member) as source:
+        if member.lower().endswith(".parquet"):
+            yield from iter_parquet_batches(source, batch_size)
+        else:
+            yield from iter_csv_batches(source, batch_size, compression=compression)
+
+
+def iter_parquet_batches(source, batch_size=SHEET_BATCH_SIZE):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet uploads need the 'pyarrow' package to be installed.")
+
+    parquet_file = pq.ParquetFile(source)
+    try:
+        for record_batch in parquet_file.iter_batches(batch_size=batch_size):
+            yield record_batch.to_pandas()
+    finally:
+        parquet_file.close()
+
+
+def _checked_batches(batches, sheet_name):
+    try:
+        for df in batches:
+            print(f"Sheet '{sheet_name}' batch parsed. Shape: {df.shape}")
+            yield df
     except Exception as e:
-        print(f"Error occurred while reading Excel file: {str(e)}")
-        raise ValueError(f"Invalid Excel file: {str(e)}")
+        print(f"Error occurred while reading sheet '{sheet_name}': {str(e)}")
+        raise ValueError(f"Invalid file: {str(e)}")
+
+
+def read_excel(file_path, filename, batch_size, stack):
+    if filename.lower().endswith(".xls"):
+        print("Loading legacy Excel file into pandas...")
+        xls = pd.ExcelFile(file_path)
+        return {
+            sheet_name.lower(): _checked_batches(iter([xls.parse(sheet_name)]), sheet_name)
+            for sheet_name in xls.sheet_names
+        }
+
+    print("Opening Excel file in read-only mode...")
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    stack.callback(workbook.close)
+    return {
+        worksheet.title.lower(): _checked_batches(iter_sheet_batches(worksheet, batch_size), worksheet.title)
+        for worksheet in workbook.worksheets
+    }
+
+
+def read_csv(file_path, filename, batch_size, stack):
+    table_name = table_name_from(filename)
+    return {table_name: _checked_batches(iter_csv_batches(file_path, batch_size, compression=None), table_name)}
+
+
+def read_gzip_csv(file_path, filename, batch_size, stack):
+    table_name = table_name_from(filename)
+    return {table_name: _checked_batches(iter_csv_batches(file_path, batch_size, compression="gzip"), table_name)}
+
+
+def read_zip(file_path, filename, batch_size, stack):
+    archive = stack.enter_context(zipfile.ZipFile(file_path))
+    tables = {}
+    for member in archive.namelist():
+        lowered = member.lower()
+        if member.endswith("/") or not lowered.endswith((".csv", ".csv.gz", ".parquet")):
+            continue
+
+        table_name = table_name_from(member)
+        compression = "gzip" if lowered.endswith(".gz") else None
+        tables[table_name] = _checked_batches(
+            iter_zip_member_batches(archive, member, batch_size, compression), table_name
+        )
+
+    if not tables:
+        raise ValueError("Zip archive does not contain any CSV or Parquet files.")
+    return tables
+
+
+def read_parquet(file_path, filename, batch_size, stack):
+    table_name = table_name_from(filename)
+    return {table_name: _checked_batches(iter_parquet_batches(file_path, batch_size), table_name)}
+
+
+READERS = {
+    "xlsx": read_excel,
+    "xls": read_excel,
+    "csv": read_csv,
+    "csv.gz": read_gzip_csv,
+    "zip": read_zip,
+    "parquet": read_parquet,
+}
+
+
+@contextmanager
+def read_file_sync(file_path: str, filename: str, batch_size=SHEET_BATCH_SIZE, content_type: str = None):
+    print(f"Starting to read file: {filename}")
+
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        print("File content is empty.")
+        raise ValueError("Uploaded file is empty.")
+
+    with ExitStack() as stack:
+        try:
+            file_format = detect_format(filename, content_type)
+            all_sheets = READERS[file_format](file_path, filename, batch_size, stack)
+            print(f"File opened successfully as {file_format}. Tables: {list(all_sheets)}")
+
+        except Exception as e:
+            print(f"Error occurred while reading file: {str(e)}")
+            raise ValueError(f"Invalid file: {str(e)}")
+
+        yield all_sheets
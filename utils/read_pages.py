@@ -0,0 +1,44 @@
+import json
+import os
+from sqlalchemy import select
+from utils.response_cache import response_cache, database_key
+
+READ_PAGE_SIZE = int(os.getenv("READ_PAGE_SIZE", "100"))
+READ_PAGE_MAX = int(os.getenv("READ_PAGE_MAX", "1000"))
+
+
+def read_page(engine, table, after=None, limit=READ_PAGE_SIZE, filters=None):
+    """Return up to limit rows with an id above after, as plain dicts, and the cursor of the next page.
+
+    Rows come straight from a Core select, so no ORM objects are built.
+    One row past the page is fetched to tell whether another page exists.
+    """
+    pk = table.c.id
+    query = select(table).order_by(pk).limit(limit + 1)
+    if after is not None:
+        query = query.where(pk > after)
+    for column, value in (filters or {}).items():
+        if value is not None:
+            query = query.where(table.c[column] == value)
+
+    with engine.connect() as conn:
+        rows = [dict(row._mapping) for row in conn.execute(query)]
+
+    next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def page_response(engine, table, after=None, limit=READ_PAGE_SIZE, filters=None):
+    """Return (JSON body, ETag) for a page, from the response cache when it's there."""
+    database = database_key(engine)
+    filters = {column: value for column, value in (filters or {}).items() if value is not None}
+    request_key = (table.name, after, limit, tuple(sorted(filters.items())))
+
+    cached = response_cache.get(database, request_key)
+    if cached is not None:
+        return cached
+
+    generation = response_cache.generation(database)
+    items, next_cursor = read_page(engine, table, after, limit, filters)
+    body = json.dumps({"items": items, "next_cursor": next_cursor}, default=str).encode("utf-8")
+    return body, response_cache.put(database, request_key, body, generation)
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+
+READ_CACHE_SIZE = int(os.getenv("READ_CACHE_SIZE", "256"))
+READ_CACHE_TTL = int(os.getenv("READ_CACHE_TTL", "30"))
+
+
+def database_key(engine):
+    return engine.url.host, engine.url.database
+
+
+def body_etag(body):
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+class ResponseCache:
+    """Serialized read responses per (server, database, request).
+
+    Entries expire after ttl seconds and the least recently used one is
+    dropped past max_entries. Every commit on a watched engine drops the
+    entries of that database, and bumps its generation so a response that
+    was being read while the commit happened isn't stored.
+    """
+
+    def __init__(self, max_entries=READ_CACHE_SIZE, ttl=READ_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def generation(self, database):
+        with self.lock:
+            return self.generations.get(database, 0)
+
+    def get(self, database, request_key):
+        """Return (body, etag) for a cached response, or None."""
+        key = (database, request_key)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            body, etag, created_at = entry
+            if time.time() - created_at >= self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return body, etag
+
+    def put(self, database, request_key, body, generation):
+        etag = body_etag(body)
+        with self.lock:
+            if self.generations.get(database, 0) == generation and self.max_entries > 0:
+                self.entries[(database, request_key)] = (body, etag, time.time())
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return etag
+
+    def invalidate(self, database=None):
+        with self.lock:
+            if database is None:
+                self.entries.clear()
+                self.generations = {key: value + 1 for key, value in self.generations.items()}
+                return
+            self.generations[database] = self.generations.get(database, 0) + 1
+            for key in [key for key in self.entries if key[0] == database]:
+                del self.entries[key]
+
+    def watch(self, engine):
+        # Upload and migration jobs commit every chunk they write, so cached
+        # pages of a database never outlive the next change to it.
+        database = database_key(engine)
+
+        @event.listens_for(engine, "commit")
+        def commit(conn):
+            self.invalidate(database)
+
+
+response_cache = ResponseCache()
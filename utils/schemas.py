@@ -1,3 +1,4 @@
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -55,3 +56,23 @@ class ProductResponse(ProductCreate):
     model_config = {
         "from_attributes": True
     }
+
+
+class UserPage(BaseModel):
+    items: List[UserResponse]
+    next_cursor: Optional[int] = None
+
+
+class PostPage(BaseModel):
+    items: List[PostResponse]
+    next_cursor: Optional[int] = None
+
+
+class CommentPage(BaseModel):
+    items: List[CommentResponse]
+    next_cursor: Optional[int] = None
+
+
+class ProductPage(BaseModel):
+    items: List[ProductResponse]
+    next_cursor: Optional[int] = None
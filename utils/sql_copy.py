@@ -0,0 +1,210 @@
+import os
+import time
+from sqlalchemy import table as table_clause, column, select, insert, exists, func, and_, or_, text, literal, Integer
+
+from utils.checkpoints import save_checkpoint, id_mappings
+from utils.bulk_writer import TABLOCK
+from utils.batch_sizing import with_back_off
+
+MIGRATION_SQL_COPY = os.getenv("MIGRATION_SQL_COPY", "1") == "1"
+
+# Tables whose rows are deduplicated on a natural key instead of by ID. A
+# source row matching a target row on that key is mapped to that row's ID
+# instead of being copied. Tables of that name without the key column are
+# copied by ID like any other.
+NATURAL_KEYS = {"users": "email"}
+
+
+def natural_key(table):
+    key = NATURAL_KEYS.get(table.name.lower())
+    return key if key is not None and key in table.c else None
+
+
+def same_instance(source_engine, target_engine):
+    source_url, target_url = source_engine.url, target_engine.url
+    return (
+        source_url.get_backend_name() == target_url.get_backend_name() == "mssql"
+        and (source_url.host or "").lower() == (target_url.host or "").lower()
+        and source_url.port == target_url.port
+    )
+
+
+class SqlCopy:
+    """Copies tables with INSERT ... SELECT inside the target database.
+
+    Used when the source and target databases live on the same server, so
+    rows never travel through Python. Statements run on the target session
+    and read the source through its schema (e.g. [source_db].[dbo]). ID
+    offsets and foreign-key remapping follow the same rules as the
+    prepare_* transforms, with the ID map read from and written to the
+    migration_id_map table instead of memory.
+    """
+
+    def __init__(self, source_schema):
+        self.source_schema = source_schema
+
+    @classmethod
+    def between(cls, source_engine, target_engine, source_db, owner="dbo"):
+        if not MIGRATION_SQL_COPY or not same_instance(source_engine, target_engine):
+            return None
+        return cls(f"[{source_db}].[{owner}]")
+
+    def source(self, table):
+        return table_clause(table.name, *[column(c.name) for c in table.columns], schema=self.source_schema)
+
+    def id_mapping(self, name, source_key, table_name, source_id):
+        """Return an alias of the ID map table and the condition joining it to source_id."""
+        mapping = id_mappings.alias(name)
+        return mapping, and_(
+            mapping.c.source_key == source_key,
+            mapping.c.table_name == table_name,
+            mapping.c.source_id == source_id
+        )
+
+    def build_rows(self, table, id_maps, source_key, lower=None, upper=None, high=None):
+        """Return (source alias, from clause, column values, conditions) for the rows of a key range.
+
+        Foreign keys to migrated tables are remapped through the IDs their
+        rows were given, by this run or an earlier one; rows whose parent
+        wasn't migrated are left out.
+        """
+        pk = list(table.primary_key.columns)[0]
+        s = self.source(table).alias("s")
+        values = {c.name: s.c[c.name] for c in table.columns}
+        from_clause = s
+        conditions = []
+
+        for fk in table.foreign_keys:
+            name = fk.parent.name
+            parent_column = fk.column
+            parent = parent_column.table
+
+            if parent.name in id_maps and parent_column.primary_key:
+                mapping, on = self.id_mapping(f"m_{name}", source_key, parent.name, s.c[name])
+                from_clause = from_clause.outerjoin(mapping, on)
+                if parent is table:
+                    # A parent not copied yet comes later in this run, at
+                    # source ID + this run's offset.
+                    values[name] = func.coalesce(mapping.c.target_id, s.c[name] + id_maps[table.name].offset)
+                else:
+                    values[name] = mapping.c.target_id
+                    conditions.append(or_(s.c[name].is_(None), mapping.c.target_id.is_not(None)))
+            elif parent is not table:
+                conditions.append(or_(s.c[name].is_(None), exists().where(parent_column == s.c[name])))
+
+        if lower is not None:
+            conditions.append(s.c[pk.name] >= lower)
+        if upper is not None:
+            conditions.append(s.c[pk.name] < upper)
+        if high is not None:
+            conditions.append(s.c[pk.name] <= high)
+
+        return s, from_clause, values, conditions
+
+    def build_mapping_insert(self, table, id_maps, source_key, lower=None, upper=None, high=None):
+        # Gives the range's new source rows their target IDs: the existing
+        # row's for a natural-key match, source ID + offset for the others.
+        pk = list(table.primary_key.columns)[0]
+        s, from_clause, _, conditions = self.build_rows(table, id_maps, source_key, lower, upper, high)
+
+        target_id = s.c[pk.name] + id_maps[table.name].offset
+        key = natural_key(table)
+        if key is not None:
+            existing = table.alias("existing")
+            from_clause = from_clause.outerjoin(existing, existing.c[key] == s.c[key])
+            target_id = func.coalesce(existing.c[pk.name], target_id)
+
+        mapped, on = self.id_mapping("mapped", source_key, table.name, s.c[pk.name])
+        conditions.append(~exists().select_from(mapped).where(on))
+
+        query = select(
+            literal(source_key), literal(table.name), s.c[pk.name], target_id
+        ).select_from(from_clause).where(and_(*conditions))
+        return insert(id_mappings).from_select(["source_key", "table_name", "source_id", "target_id"], query)
+
+    def build_insert(self, table, id_maps, source_key, lower=None, upper=None, high=None):
+        pk = list(table.primary_key.columns)[0]
+        s, from_clause, values, conditions = self.build_rows(table, id_maps, source_key, lower, upper, high)
+
+        if isinstance(pk.type, Integer):
+            # Rows mapped to a row the target already has (or had from an
+            # earlier run) aren't inserted again.
+            own, on = self.id_mapping("own", source_key, table.name, s.c[pk.name])
+            from_clause = from_clause.join(own, on)
+            values[pk.name] = own.c.target_id
+            conditions.append(~exists().where(pk == own.c.target_id))
+        else:
+            conditions.append(~exists().where(pk == s.c[pk.name]))
+
+        query = select(*values.values()).select_from(from_clause).where(and_(*conditions))
+        return insert(table).from_select(list(values), query)
+
+    def source_bounds(self, session, table, lower=None, upper=None):
+        pk = list(table.primary_key.columns)[0]
+        s = self.source(table)
+        query = select(func.min(s.c[pk.name]), func.max(s.c[pk.name]))
+        if lower is not None:
+            query = query.where(s.c[pk.name] >= lower)
+        if upper is not None:
+            query = query.where(s.c[pk.name] < upper)
+        return tuple(session.execute(query).one())
+
+    def copy_range(self, session, table, id_maps, source_key, lower=None, upper=None, checkpoint=None, sizer=None):
+        """Copy one key range and return the rows inserted.
+
+        Without a sizer the range is a single statement. With one, and an
+        integer key, it is copied in slices of sizer.size source keys, each
+        committed with its checkpoint, so one statement never has to carry
+        a whole large table and a slice that fails in a way a smaller one
+        can fix is retried smaller.
+        """
+        # The upper bound is fixed before the insert so the checkpoint
+        # matches what was copied even if the source keeps growing.
+        low, high = self.source_bounds(session, table, lower, upper)
+        if high is None:
+            return 0
+
+        pk = list(table.primary_key.columns)[0]
+        if sizer is None or not isinstance(pk.type, Integer):
+            return self._copy(session, table, id_maps, source_key, lower, upper, high, checkpoint)
+
+        inserted = 0
+        start = low
+        while start <= high:
+            def attempt(start=start):
+                end = min(start + sizer.size, high + 1)
+                started = time.perf_counter()
+                count = self._copy(session, table, id_maps, source_key, start, end, end - 1, checkpoint)
+                sizer.observe(end - start, time.perf_counter() - started)
+                return count, end
+
+            count, start = with_back_off(sizer, attempt, session.rollback)
+            inserted += count
+        return inserted
+
+    def _copy(self, session, table, id_maps, source_key, lower, upper, high, checkpoint):
+        connection = session.connection()
+        identity_insert = connection.dialect.name == "mssql" and table.autoincrement_column is not None
+        target_name = connection.dialect.identifier_preparer.format_table(table)
+
+        # The IDs are recorded first and the rows inserted with them, in
+        # the same transaction as the checkpoint.
+        if isinstance(list(table.primary_key.columns)[0].type, Integer):
+            session.execute(self.build_mapping_insert(table, id_maps, source_key, lower, upper, high))
+
+        if identity_insert:
+            session.execute(text(f"SET IDENTITY_INSERT {target_name} ON"))
+        try:
+            statement = self.build_insert(table, id_maps, source_key, lower, upper, high)
+            if session.info.get(TABLOCK):
+                statement = statement.with_hint("WITH (TABLOCK)", dialect_name="mssql")
+            inserted = session.execute(statement).rowcount
+        finally:
+            if identity_insert:
+                session.execute(text(f"SET IDENTITY_INSERT {target_name} OFF"))
+
+        if checkpoint is not None:
+            source_key, range_index = checkpoint
+            save_checkpoint(session, source_key, table.name, range_index, high)
+        session.commit()
+        return inserted
@@ -0,0 +1,70 @@
+import os
+import pandas as pd
+from sqlalchemy import select, func, text
+
+from utils.bulk_writer import BulkWriter
+from utils.upsert import create_staging_table, frame_records
+
+DEDUP_IN_MEMORY_MAX_ROWS = int(os.getenv("DEDUP_IN_MEMORY_MAX_ROWS", "100000"))
+
+
+def estimate_row_count(session, table):
+    if session.get_bind().dialect.name == "mssql":
+        estimate = session.execute(
+            text(
+                "SELECT SUM(p.rows) FROM sys.partitions p "
+                "WHERE p.object_id = OBJECT_ID(:table_name) AND p.index_id IN (0, 1)"
+            ),
+            {"table_name": f"{table.schema or 'dbo'}.{table.name}"}
+        ).scalar()
+        if estimate is not None:
+            return estimate
+
+    return session.execute(select(func.count()).select_from(table)).scalar()
+
+
+class TargetKeys:
+    """Finds which values of a key column already exist in a target table.
+
+    A small target (by row estimate) is loaded into memory once. For a
+    larger one, each batch of keys is staged in a temp table and joined
+    against the target column inside the database, so memory and transfer
+    follow the batch size instead of the target size.
+    """
+
+    def __init__(self, session, column, value_column=None, max_in_memory_rows=DEDUP_IN_MEMORY_MAX_ROWS):
+        self.column = column
+        self.value_column = column if value_column is None else value_column
+        self.known = None
+
+        if estimate_row_count(session, column.table) <= max_in_memory_rows:
+            self.known = self._series(session.execute(select(self.column, self.value_column)).fetchall())
+
+    def _series(self, rows):
+        values = pd.Series([row[1] for row in rows], index=[row[0] for row in rows], dtype=object)
+        return values[~values.index.duplicated()]
+
+    def match(self, session, keys):
+        """Return the existing keys among a Series of keys, as a Series of key -> value_column."""
+        keys = keys.dropna().drop_duplicates()
+        if self.known is not None:
+            return self.known[self.known.index.isin(keys)]
+        if keys.empty:
+            return self._series([])
+
+        name = self.column.name
+        stage = create_staging_table(session, self.column.table, [name])
+        writer = BulkWriter(session, stage, commit=False)
+        writer.write(frame_records(keys.to_frame(name)))
+        writer.flush()
+
+        rows = session.execute(
+            select(stage.c[name], self.value_column)
+            .select_from(stage.join(self.column.table, self.column == stage.c[name]))
+        ).fetchall()
+        stage.drop(bind=session.connection())
+        return self._series(rows)
+
+    def contains(self, session, keys):
+        """Return a boolean array telling which keys exist in the target."""
+        return keys.isin(self.match(session, keys).index).to_numpy()
@@ -1,50 +1,174 @@
+import os
+from contextlib import ExitStack
 from database.dest_db import TargetDatabaseHandler
-from utils.handle_functions import migrate_known_tables, reflect_metadata
+from utils.handle_functions import migrate_known_tables, reflect_metadata, MIGRATION_RANGE_WORKERS
 from database.source_db import DatabaseHandler
 from utils.read_file import read_file_sync
-from utils.insert_data import insert_data_in_table
+from utils.insert_data import insert_data_in_table, UPSERT_RULES
+from utils.checkpoints import ensure_checkpoint_table
+from utils.sql_copy import SqlCopy
+from database.schema_bootstrap import schema_bootstrap
+from database.schema_cache import schema_cache
+from utils.bulk_load import bulk_load, BULK_LOAD_MODE
+from utils.metrics import metrics, REFLECTION
+from utils.batch_sizing import ADAPTIVE_BATCH_SIZE
+from utils.fan_out import FanOutTarget, fan_out_known_tables
 
-def run_insert_data(db_name: str, file_content: bytes, filename: str):
+def run_insert_data(db_name: str, file_path: str, filename: str, content_type: str = None,
+                    bulk_load_mode: bool = BULK_LOAD_MODE, job=None):
     db_handler = DatabaseHandler(db_name)
     try:
         db_handler.create_db()
         db_handler.connect_db()
         db_handler.init_db()
 
-        sheets_dict = read_file_sync(file_content, filename)
-        insert_data_in_table(sheets_dict, db_handler)
+        batch_sizers = {} if ADAPTIVE_BATCH_SIZE else None
+        with bulk_load(db_handler.engine, UPSERT_RULES, bulk_load_mode) as load:
+            session_factory = load.session_factory(db_handler.get_session) if load else None
+            with read_file_sync(file_path, filename, content_type=content_type) as sheets_dict:
+                results = insert_data_in_table(
+                    sheets_dict, db_handler, job=job, session_factory=session_factory, batch_sizers=batch_sizers
+                )
+        if load is not None:
+            results["bulk_load"] = load.report
+        if batch_sizers:
+            results["batch_sizes"] = {name: sizer.report() for name, sizer in batch_sizers.items()}
 
         print("Data inserted successfully.")
+        return results
 
     except Exception as e:
         print(f"Data processing failed: {str(e)}")
+        schema_bootstrap.invalidate(db_handler.host, db_name)
+        raise
     finally:
         db_handler.disconnect_db()
+        if os.path.exists(file_path):
+            os.remove(file_path)
 
 
-def run_migration(source_db: str, target_db: str):
+def run_migration(source_db: str, target_db: str, range_workers: int = MIGRATION_RANGE_WORKERS, tables=None,
+                  bulk_load_mode: bool = BULK_LOAD_MODE, job=None):
     source_handler = DatabaseHandler(source_db)
     target_handler = TargetDatabaseHandler(target_db)
 
     try:
         source_handler.connect_db()
-        source_metadata = reflect_metadata(source_handler)
+        with metrics.timer(REFLECTION, job) as timer:
+            source_metadata = reflect_metadata(source_handler, tables)
+            timer.rows = len(source_metadata.tables)
 
         target_handler.create_db()
         target_handler.init_db(source_metadata)
+        ensure_checkpoint_table(target_handler.engine)
 
-        inserted_counts = migrate_known_tables(
-            source_handler.session,
-            target_handler.session,
-            source_metadata
-        )
+        sql_copy = SqlCopy.between(source_handler.engine, target_handler.engine, source_db)
+        if sql_copy is not None:
+            print(f"'{source_db}' and '{target_db}' share a server, copying with INSERT ... SELECT")
+
+        batch_sizers = {} if ADAPTIVE_BATCH_SIZE else None
+        with bulk_load(target_handler.engine, source_metadata.tables, bulk_load_mode) as load:
+            inserted_counts = migrate_known_tables(
+                source_handler.get_session,
+                load.session_factory(target_handler.get_session) if load else target_handler.get_session,
+                source_metadata,
+                job=job,
+                range_workers=range_workers,
+                source_key=f"{source_handler.host}/{source_db}",
+                sql_copy=sql_copy,
+                batch_sizers=batch_sizers
+            )
 
         print(f"Migration completed from '{source_db}' to '{target_db}'")
         print(f"Tables migrated: {list(source_metadata.tables.keys())}")
         print(f"Rows inserted: {inserted_counts}")
+        result = {"inserted": inserted_counts}
+        if load is not None:
+            result["bulk_load"] = load.report
+        if batch_sizers:
+            result["batch_sizes"] = {name: sizer.report() for name, sizer in batch_sizers.items()}
+        return result
 
     except Exception as e:
         print(f"Migration failed: {str(e)}")
+        schema_bootstrap.invalidate(target_handler.host, target_db)
+        # The failure may come from a reflection that no longer matches the
+        # source; the next run reflects it again.
+        if source_handler.engine is not None:
+            schema_cache.invalidate(source_handler.engine)
+        raise
     finally:
         source_handler.disconnect_db()
         target_handler.disconnect()
+
+
+def run_fan_out_migration(source_db: str, target_dbs: list, tables=None, bulk_load_mode: bool = BULK_LOAD_MODE,
+                          job=None):
+    """Migrate one source database into several targets, reading the source once.
+
+    A target that fails is reported with its error and the others carry
+    on; the job fails only when every target has.
+    """
+    source_handler = DatabaseHandler(source_db)
+    target_handlers = {target_db: TargetDatabaseHandler(target_db) for target_db in target_dbs}
+
+    try:
+        source_handler.connect_db()
+        with metrics.timer(REFLECTION, job) as timer:
+            source_metadata = reflect_metadata(source_handler, tables)
+            timer.rows = len(source_metadata.tables)
+
+        for target_handler in target_handlers.values():
+            target_handler.create_db()
+            target_handler.init_db(source_metadata)
+            ensure_checkpoint_table(target_handler.engine)
+
+        with ExitStack() as stack:
+            targets = []
+            loads = {}
+            for target_db, target_handler in target_handlers.items():
+                load = stack.enter_context(bulk_load(target_handler.engine, source_metadata.tables, bulk_load_mode))
+                loads[target_db] = load
+                targets.append(FanOutTarget(
+                    target_db,
+                    load.session_factory(target_handler.get_session) if load else target_handler.get_session,
+                    {} if ADAPTIVE_BATCH_SIZE else None
+                ))
+
+            fan_out_known_tables(
+                source_handler.get_session,
+                targets,
+                source_metadata,
+                job=job,
+                source_key=f"{source_handler.host}/{source_db}"
+            )
+
+        results = {}
+        for target in targets:
+            result = {"inserted": target.inserted}
+            if target.error is not None:
+                result["error"] = target.error
+                schema_bootstrap.invalidate(target_handlers[target.name].host, target.name)
+                schema_cache.invalidate(source_handler.engine)
+            if loads[target.name] is not None:
+                result["bulk_load"] = loads[target.name].report
+            if target.batch_sizers:
+                result["batch_sizes"] = {name: sizer.report() for name, sizer in target.batch_sizers.items()}
+            results[target.name] = result
+
+        print(f"Migration completed from '{source_db}' to {list(target_dbs)}")
+        print(f"Tables migrated: {list(source_metadata.tables.keys())}")
+        print(f"Rows inserted: {({name: result['inserted'] for name, result in results.items()})}")
+        return {"targets": results}
+
+    except Exception as e:
+        print(f"Migration failed: {str(e)}")
+        for target_db, target_handler in target_handlers.items():
+            schema_bootstrap.invalidate(target_handler.host, target_db)
+        if source_handler.engine is not None:
+            schema_cache.invalidate(source_handler.engine)
+        raise
+    finally:
+        source_handler.disconnect_db()
+        for target_handler in target_handlers.values():
+            target_handler.disconnect()
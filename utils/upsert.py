@@ -0,0 +1,157 @@
+from sqlalchemy import MetaData, Table, Column, Integer, select, delete, update, exists, and_, text
+
+from utils.bulk_writer import BulkWriter, BULK_BATCH_SIZE, TABLOCK
+
+ROW_COLUMN = "source_row"
+
+
+def frame_records(df):
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict('records')
+
+
+def create_staging_table(session, table, columns):
+    connection = session.connection()
+    if connection.dialect.name == "mssql":
+        name, prefixes = f"#stage_{table.name}", []
+    else:
+        name, prefixes = f"stage_{table.name}", ["TEMPORARY"]
+
+    stage = Table(
+        name,
+        MetaData(),
+        Column(ROW_COLUMN, Integer),
+        *[Column(column, table.c[column].type) for column in columns],
+        prefixes=prefixes
+    )
+    if connection.dialect.name != "mssql":
+        # pysqlite commits the CREATE of a temp table on its own, so one
+        # left by a batch that was rolled back can still be there.
+        stage.drop(bind=connection, checkfirst=True)
+    stage.create(bind=connection)
+    return stage
+
+
+def _key_matches(left, right, key_columns):
+    return and_(*[left.c[column] == right.c[column] for column in key_columns])
+
+
+def _merge(session, table, stage, columns, key_columns, update_existing):
+    connection = session.connection()
+    quote = connection.dialect.identifier_preparer.quote
+    target_name = connection.dialect.identifier_preparer.format_table(table)
+
+    on_clause = " AND ".join(f"t.{quote(c)} = s.{quote(c)}" for c in key_columns)
+    insert_columns = ", ".join(quote(c) for c in columns)
+    insert_values = ", ".join(f"s.{quote(c)}" for c in columns)
+    update_columns = [c for c in columns if c not in key_columns and not table.c[c].primary_key]
+
+    hints = "TABLOCK, HOLDLOCK" if session.info.get(TABLOCK) else "HOLDLOCK"
+    statement = (
+        f"MERGE INTO {target_name} WITH ({hints}) AS t "
+        f"USING {quote(stage.name)} AS s ON {on_clause} "
+    )
+    if update_existing and update_columns:
+        assignments = ", ".join(f"t.{quote(c)} = s.{quote(c)}" for c in update_columns)
+        statement += f"WHEN MATCHED THEN UPDATE SET {assignments} "
+    statement += (
+        f"WHEN NOT MATCHED BY TARGET THEN INSERT ({insert_columns}) VALUES ({insert_values}) "
+        f"OUTPUT $action;"
+    )
+
+    identity_insert = any(table.c[c].primary_key for c in columns)
+    if identity_insert:
+        session.execute(text(f"SET IDENTITY_INSERT {target_name} ON"))
+    try:
+        actions = [row[0] for row in session.execute(text(statement))]
+    finally:
+        if identity_insert:
+            session.execute(text(f"SET IDENTITY_INSERT {target_name} OFF"))
+
+    return actions.count("INSERT"), actions.count("UPDATE")
+
+
+def _update_then_insert(session, table, stage, columns, key_columns, update_existing):
+    updated = 0
+    update_columns = [c for c in columns if c not in key_columns and not table.c[c].primary_key]
+    if update_existing and update_columns:
+        updated = session.execute(
+            update(table)
+            .values({c: stage.c[c] for c in update_columns})
+            .where(_key_matches(table, stage, key_columns))
+        ).rowcount
+
+    inserted = session.execute(
+        table.insert().from_select(
+            columns,
+            select(*[stage.c[c] for c in columns]).where(
+                ~exists().where(_key_matches(table, stage, key_columns))
+            )
+        )
+    ).rowcount
+
+    return inserted, updated
+
+
+def upsert_frame(session, table, df, key_columns, update_existing=True, foreign_key=None,
+                 batch_size=BULK_BATCH_SIZE):
+    counts = {"inserted": 0, "updated": 0, "skipped": 0, "invalid_keys": []}
+    if df.empty:
+        return counts
+
+    unknown = [c for c in df.columns if c not in table.c]
+    if unknown:
+        raise ValueError(f"Unknown columns for table {table.name}: {unknown}")
+
+    columns = list(df.columns)
+    records = frame_records(df)
+    for position, record in enumerate(records):
+        record[ROW_COLUMN] = position
+
+    stage = create_staging_table(session, table, columns)
+    writer = BulkWriter(session, stage, batch_size, commit=False)
+    writer.write(records)
+    staged = writer.flush()
+
+    if foreign_key:
+        fk_column, parent_table = foreign_key
+        orphan = ~exists().where(parent_table.primary_key.columns[0] == stage.c[fk_column])
+        counts["invalid_keys"] = list(session.execute(
+            select(stage.c[fk_column]).where(orphan).order_by(stage.c[ROW_COLUMN])
+        ).scalars())
+        session.execute(delete(stage).where(orphan))
+        counts["skipped"] += len(counts["invalid_keys"])
+        staged -= len(counts["invalid_keys"])
+
+    # Later sheet rows win over earlier ones with the same natural key,
+    # the same as applying them to the database one after another.
+    later = stage.alias("later")
+    duplicates = session.execute(
+        delete(stage).where(
+            exists().where(and_(
+                _key_matches(later, stage, key_columns),
+                later.c[ROW_COLUMN] > stage.c[ROW_COLUMN]
+            ))
+        )
+    ).rowcount
+    staged -= duplicates
+    if update_existing:
+        counts["updated"] += duplicates
+    else:
+        counts["skipped"] += duplicates
+
+    if session.connection().dialect.name == "mssql":
+        inserted, updated = _merge(session, table, stage, columns, key_columns, update_existing)
+    else:
+        inserted, updated = _update_then_insert(session, table, stage, columns, key_columns, update_existing)
+
+    counts["inserted"] += inserted
+    counts["updated"] += updated
+    if not update_existing:
+        counts["skipped"] += staged - inserted
+
+    # A failed upsert is rolled back by the caller, which also undoes the
+    # staging table because it was created inside the same transaction.
+    stage.drop(bind=session.connection())
+
+    return counts
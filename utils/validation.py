@@ -0,0 +1,138 @@
+import os
+from collections import Counter
+import numpy as np
+import pandas as pd
+from sqlalchemy import Integer, String
+
+REJECT_SAMPLE_SIZE = int(os.getenv("REJECT_SAMPLE_SIZE", "100"))
+
+# Integer columns are INT on SQL Server.
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+# Sheet row of the first data row: row 1 holds the header.
+FIRST_DATA_ROW = 2
+
+
+class RejectReport:
+    """Rows split off by validation for one table.
+
+    Counts every rejected row and every (column, reason) pair, and keeps
+    up to sample_size rows with their sheet row number, the offending
+    value and why it was refused.
+    """
+
+    def __init__(self, sample_size=REJECT_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self.rejected = 0
+        self.reasons = Counter()
+        self.samples = []
+
+    def add(self, rows, column, reason, values):
+        self.reasons[f"{column}: {reason}"] += len(rows)
+        room = self.sample_size - len(self.samples)
+        for row, value in zip(rows[:room], values[:room]):
+            self.samples.append({
+                "row": int(row),
+                "column": column,
+                "reason": reason,
+                "value": None if pd.isna(value) else str(value),
+            })
+
+    def to_dict(self):
+        return {"rejected": self.rejected, "reasons": dict(self.reasons), "samples": self.samples}
+
+
+def coerce_integers(series):
+    """Return (Int64 series, mask of values that aren't whole numbers in INT range)."""
+    numbers = pd.to_numeric(series, errors="coerce")
+    invalid = series.notna().to_numpy() & numbers.isna().to_numpy()
+    fractional = numbers.notna().to_numpy() & (numbers.fillna(0).to_numpy() % 1 != 0)
+    out_of_range = ((numbers < INT_MIN) | (numbers > INT_MAX)).fillna(False).to_numpy()
+    bad = invalid | fractional | out_of_range
+    return numbers.where(~bad).astype("Float64").astype("Int64"), bad
+
+
+def coerce_strings(series):
+    # Sheets hand over numbers and dates in text columns as such; they're
+    # stored as their text like the driver would.
+    return series.astype("string")
+
+
+def field_types(schema, table):
+    """Return {column: (python type, required)} for the columns validate_frame checks.
+
+    Fields come from the Pydantic create schema; columns of the table the
+    schema doesn't cover (e.g. id) are checked by their SQL type only.
+    """
+    fields = {}
+    for column in table.columns:
+        field = schema.model_fields.get(column.name)
+        if field is not None:
+            fields[column.name] = (field.annotation, field.is_required())
+        elif isinstance(column.type, Integer):
+            fields[column.name] = (int, False)
+        elif isinstance(column.type, String):
+            fields[column.name] = (str, False)
+    return fields
+
+
+def validate_frame(df, schema, table, key_columns, report, first_row=FIRST_DATA_ROW, update_existing=True):
+    """Check a batch against schema and the table's column types.
+
+    Every check runs over whole columns: values are coerced to the schema
+    type, required fields must be present, strings must fit the column
+    length, and of several rows sharing a natural key only one is kept,
+    the same row the upsert would have ended up with: the last when rows
+    are updated, the first when existing rows are left alone. Rows failing
+    any check go to report; the coerced, clean rows are returned.
+    """
+    df = df.reset_index(drop=True)
+    rows = np.arange(first_row, first_row + len(df))
+    bad = np.zeros(len(df), dtype=bool)
+    clean = {}
+
+    def reject(column, reason, mask, values):
+        nonlocal bad
+        mask = mask & ~bad
+        if mask.any():
+            report.add(rows[mask], column, reason, np.asarray(values, dtype=object)[mask])
+            bad |= mask
+
+    for column, (field_type, required) in field_types(schema, table).items():
+        if column not in df.columns:
+            if required:
+                reject(column, "column is missing", np.ones(len(df), dtype=bool), [None] * len(df))
+            continue
+
+        original = df[column]
+        if field_type is int:
+            values, invalid = coerce_integers(original)
+            reject(column, "not a whole number in INT range", invalid, original)
+        else:
+            values = coerce_strings(original)
+            length = getattr(table.c[column].type, "length", None)
+            if length:
+                too_long = (values.str.len() > length).fillna(False).to_numpy()
+                reject(column, f"longer than {length} characters", too_long, original)
+
+        if required:
+            reject(column, "is required", values.isna().to_numpy(), original)
+        clean[column] = values
+
+    checked = pd.DataFrame(clean)
+    extra = [column for column in df.columns if column not in checked.columns]
+    checked = pd.concat([checked, df[extra]], axis=1)[list(df.columns)] if extra else checked
+
+    keys = [column for column in key_columns if column in checked.columns]
+    if keys and len(keys) == len(key_columns):
+        candidates = checked[~bad]
+        if update_existing:
+            keep, reason = "last", "duplicate key, a later row replaces it"
+        else:
+            keep, reason = "first", "duplicate of an earlier row"
+        superseded = np.zeros(len(df), dtype=bool)
+        superseded[np.flatnonzero(~bad)[candidates.duplicated(subset=keys, keep=keep).to_numpy()]] = True
+        reject(", ".join(keys), reason, superseded, checked[keys[0]].astype(object))
+
+    report.rejected += int(bad.sum())
+    return checked[~bad].reset_index(drop=True)